@@ -0,0 +1,256 @@
+import os
+import mmap
+import wave
+import subprocess
+
+from mp3_index import parse_header, scan_mp3
+
+# Silence is written from one zeroed buffer of this many milliseconds
+SILENCE_CHUNK_MS = 100
+
+
+class AudioConcatenator:
+    """Join audio files and silence gaps into one file as a stream
+
+    Each input is decoded once, converted to the output format and its PCM
+    written out immediately: straight into a WAV file, or piped to an ffmpeg
+    encoder for other formats. Silence is written from one small zeroed
+    buffer, so memory stays flat and time is linear in the total duration,
+    unlike `combined += audio`, which copies everything joined so far.
+
+    The output sample rate and channel count are those of the first file
+    unless given.
+
+    Usage:
+        with AudioConcatenator("deck.mp3") as out:
+            for clip in clips:
+                out.add_file(clip)
+                out.add_silence(4000)
+    """
+
+    def __init__(
+        self, output_file, frame_rate=None, channels=None, sample_width=2, format=None
+    ):
+        self.output_file = output_file
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.format = format or os.path.splitext(output_file)[1].lstrip(".").lower()
+        self.duration_ms = 0
+        self._writer = None
+        self._process = None
+        self._silence = None
+
+    def __enter__(self):
+        return self
+
+    def _open(self):
+        if self.format == "wav":
+            self._writer = wave.open(self.output_file, "wb")
+            self._writer.setnchannels(self.channels)
+            self._writer.setsampwidth(self.sample_width)
+            self._writer.setframerate(self.frame_rate)
+            return
+
+        from pydub.utils import get_encoder_name
+
+        codec = {1: "u8", 2: "s16le", 4: "s32le"}[self.sample_width]
+        command = [
+            get_encoder_name(),
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            codec,
+            "-ar",
+            str(self.frame_rate),
+            "-ac",
+            str(self.channels),
+            "-i",
+            "pipe:0",
+            "-f",
+            self.format,
+            self.output_file,
+        ]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def _write(self, data):
+        if self._writer is not None:
+            self._writer.writeframesraw(data)
+        else:
+            self._process.stdin.write(data)
+
+    def add_file(self, audio_file):
+        """Decode `audio_file` and append it"""
+        from pydub import AudioSegment
+
+        audio = AudioSegment.from_file(audio_file)
+        if self.frame_rate is None:
+            self.frame_rate = audio.frame_rate
+        if self.channels is None:
+            self.channels = audio.channels
+        if self._writer is None and self._process is None:
+            self._open()
+        audio = (
+            audio.set_frame_rate(self.frame_rate)
+            .set_channels(self.channels)
+            .set_sample_width(self.sample_width)
+        )
+        self._write(audio.raw_data)
+        self.duration_ms += len(audio)
+
+    def add_silence(self, milliseconds):
+        """Append `milliseconds` of silence without allocating all of it"""
+        if self.frame_rate is None:
+            raise ValueError("add a file before silence to set the output format")
+        if self._writer is None and self._process is None:
+            self._open()
+        frame_bytes = self.sample_width * self.channels
+        if self._silence is None:
+            frames = self.frame_rate * SILENCE_CHUNK_MS // 1000
+            # Unsigned 8-bit PCM is silent at 128
+            fill = b"\x80" if self.sample_width == 1 else b"\x00"
+            self._silence = memoryview(fill * (frames * frame_bytes))
+        remaining = round(milliseconds * self.frame_rate / 1000) * frame_bytes
+        while remaining > 0:
+            chunk = self._silence[:remaining]
+            self._write(chunk)
+            remaining -= len(chunk)
+        self.duration_ms += milliseconds
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._process is not None:
+            self._process.stdin.close()
+            code = self._process.wait()
+            self._process = None
+            if code != 0:
+                raise RuntimeError(f"Encoding {self.output_file} failed ({code})")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def silent_frame(header):
+    """An MPEG Layer III frame that decodes to silence, in the format of `header`
+
+    The side information is all zero: no main data, so every coefficient is
+    zero. The lowest bitrate that holds the side information keeps it small.
+    """
+    b1 = header[1] | 0x01  # no CRC
+    mpeg1 = b1 & 0x18 == 0x18
+    mono = header[3] >> 6 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    b3 = header[3] & 0xCF  # no mode extension
+    for bitrate_index in range(1, 15):
+        b2 = (bitrate_index << 4) | (header[2] & 0x0C)
+        length = parse_header(0xFF, b1, b2, b3)[0]
+        if length >= 4 + side_info:
+            return bytes((0xFF, b1, b2, b3)) + bytes(length - 4)
+    raise ValueError("No bitrate fits a silent frame")
+
+
+def scan_clip(audio_file):
+    """(MP3Index, first frame header) of an MPEG Layer III file, or None"""
+    try:
+        index = scan_mp3(audio_file)
+    except (OSError, ValueError):
+        return None
+    with open(audio_file, "rb") as f:
+        f.seek(index.offsets[0])
+        header = f.read(4)
+    if (header[1] >> 1) & 3 != 1:
+        return None
+    return index, header
+
+
+def stream_format(index, header):
+    """What must match for frames to be joined: version, layer, rate, channels"""
+    return header[1] & 0x1E, index.sample_rate, index.channels
+
+
+def copy_frames(audio_file, index, out):
+    """Write the audio frames of `audio_file` to `out` byte for byte
+
+    Tags (ID3, the Xing/Info frame, APE) and anything between frames are left
+    out; runs of adjacent frames are written with one call.
+    """
+    # The frame length depends only on header bytes 1 and 2
+    lengths = {}
+    with open(audio_file, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        with memoryview(data) as view:
+            run_start = end = index.offsets[0]
+            for pos in index.offsets:
+                if pos != end:
+                    out.write(view[run_start:end])
+                    run_start = pos
+                key = data[pos + 1 : pos + 3]
+                length = lengths.get(key)
+                if length is None:
+                    length = lengths[key] = parse_header(0xFF, key[0], key[1], 0)[0]
+                end = pos + length
+            out.write(view[run_start:end])
+    finally:
+        data.close()
+
+
+def join_mp3_frames(file_list, output_file, gap_ms=0):
+    """Join MP3 files by copying their frames, without decoding or re-encoding
+
+    Possible when every file is MPEG Layer III with the same version, sample
+    rate and channel count, as clips from one TTS voice are; returns the
+    duration in ms, or None (writing nothing) when the formats differ. Gaps
+    are pre-encoded silent frames, rounded to whole frames (24 ms at 24 kHz).
+
+    Each file must be a complete stream, so its first frame does not borrow
+    bits from the file before it. Unlike decoding, this keeps each file's
+    encoder delay and padding (a few tens of ms of silence at its ends), and
+    the joined file has no Xing header, so players estimate the length of
+    VBR files from the bitrate of the first frame.
+    """
+    clips = []
+    for audio_file in file_list:
+        clip = scan_clip(audio_file)
+        if clip is None or (clips and stream_format(*clip) != stream_format(*clips[0])):
+            return None
+        clips.append(clip)
+    if not clips:
+        return None
+
+    index, header = clips[0]
+    samples = index.samples_per_frame
+    gap_frames = round(gap_ms * index.sample_rate / 1000 / samples)
+    gap = silent_frame(header) * gap_frames
+    frames = gap_frames * (len(clips) - 1)
+    with open(output_file, "wb") as out:
+        for i, (audio_file, (index, _)) in enumerate(zip(file_list, clips)):
+            if i:
+                out.write(gap)
+            copy_frames(audio_file, index, out)
+            frames += len(index)
+    return frames * samples * 1000 / clips[0][0].sample_rate
+
+
+def concatenate_files(file_list, output_file, gap_ms=0, frame_copy=True):
+    """Join `file_list` into `output_file` with `gap_ms` of silence between files
+
+    MP3 files of one format are joined into an MP3 by copying frames
+    (join_mp3_frames); anything else is decoded and streamed through
+    AudioConcatenator. Returns the duration in ms.
+    """
+    if frame_copy and output_file.lower().endswith(".mp3"):
+        duration = join_mp3_frames(file_list, output_file, gap_ms)
+        if duration is not None:
+            return duration
+
+    with AudioConcatenator(output_file) as out:
+        for i, audio_file in enumerate(file_list):
+            if i:
+                out.add_silence(gap_ms)
+            out.add_file(audio_file)
+    return out.duration_ms
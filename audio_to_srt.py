@@ -1,43 +1,93 @@
+import io
 import os
-import datetime
-from auditok import split
+import sys
+import math
+import time
+import argparse
+import contextlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from auditok import split, load, AudioRegion
+
+from instrumentation import StageTimer, append_metrics, profiled
+from mp3_index import load_index
+from subtitle_writer import (
+    FORMAT_EXTENSIONS,
+    SubtitleWriter,
+    format_ms,
+    read_params,
+    read_srt,
+    to_milliseconds,
+)
+
+# Same analysis window as auditok.split uses by default (seconds)
+ANALYSIS_WINDOW = 0.05
+
+SAMPLE_WIDTH_TO_DTYPE = {1: np.int8, 2: np.int16, 4: np.int32}
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg", ".m4a", ".flac")
 
 
 def format_timestamp(seconds):
     """Convert seconds to SRT timestamp format (HH:MM:SS,mmm)"""
-    time_obj = datetime.timedelta(seconds=seconds)
-    hours, remainder = divmod(time_obj.seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    milliseconds = int(time_obj.microseconds / 1000)
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+    return format_ms(to_milliseconds(seconds))
 
 
-def generate_srt(audio_regions, output_file):
-    """Generate SRT file based on audio regions"""
-    # Try to read subtitle.txt file
+def load_subtitles(subtitle_file="subtitle.txt"):
+    """Read the non-empty lines of the subtitle text file, or [] if it is missing"""
     subtitles = []
-    subtitle_file = "subtitle.txt"
     try:
         with open(subtitle_file, "r", encoding="utf-8") as sf:
             subtitles = [line.strip() for line in sf.readlines() if line.strip()]
         print(f"Successfully loaded {len(subtitles)} subtitles")
     except FileNotFoundError:
         print(f"Subtitle file not found: {subtitle_file}, will use 'xxx' as default")
+    return subtitles
+
+
+def generate_srt(
+    audio_regions,
+    output_file,
+    on_region=None,
+    params=None,
+    subtitles=None,
+    formats=("srt",),
+):
+    """Generate SRT file based on audio regions
+
+    `audio_regions` can be a list or a generator. Each cue is written as soon as
+    its region is produced, and `on_region(index, region)` is called right after,
+    so a generator is consumed in a single pass without keeping the regions.
+    If `params` is given, the detection parameters are recorded in
+    <output_file>.params.json (and in the header of WebVTT and JSON files).
+    `subtitles` are the cue texts; by default they are read from subtitle.txt.
+
+    `formats` lists the files to write in the same pass: "srt" goes to
+    `output_file`, "vtt" and "json" next to it with their own extension.
+    Returns the number of regions written.
+    """
+    if subtitles is None:
+        # Try to read subtitle.txt file
+        subtitles = load_subtitles()
 
-    with open(output_file, "w", encoding="utf-8") as f:
+    base_name = os.path.splitext(output_file)[0]
+    outputs = {
+        fmt: output_file if fmt == "srt" else base_name + FORMAT_EXTENSIONS[fmt]
+        for fmt in formats
+    }
+
+    with SubtitleWriter(outputs, params) as writer:
         for i, region in enumerate(audio_regions):
-            # Index number
-            f.write(f"{i+1}\n")
-            # Timestamp
-            start_time = format_timestamp(region.meta.start)
-            end_time = format_timestamp(region.meta.end)
-            f.write(f"{start_time} --> {end_time}\n")
             # Subtitle content (use subtitle.txt content or "xxx" if not enough)
             subtitle_text = subtitles[i] if i < len(subtitles) else "xxx"
-            f.write(f"{subtitle_text}\n\n")
+            writer.add(region.meta.start, region.meta.end, subtitle_text)
+
+            if on_region is not None:
+                on_region(i, region)
+    regions_count = writer.count
 
     # Output actual subtitle count information
-    regions_count = len(audio_regions)
     subtitles_count = len(subtitles)
     if subtitles_count < regions_count:
         print(
@@ -52,6 +102,386 @@ def generate_srt(audio_regions, output_file):
             f"Perfect match: {regions_count} audio regions and {subtitles_count} subtitle lines"
         )
 
+    return regions_count
+
+
+def frame_energies(data, sample_width, channels, block_size, chunk_frames=4096):
+    """Compute the log energy of every analysis window of raw PCM data
+
+    Gives the same values as auditok's energy validator (the loudest channel
+    wins), but for a whole chunk of windows per NumPy call. Chunks of
+    `chunk_frames` windows keep the float64 copy small for long files.
+    """
+    samples = np.frombuffer(data, dtype=SAMPLE_WIDTH_TO_DTYPE[sample_width])
+    frame_len = block_size * channels
+    n_frames = math.ceil(len(samples) / frame_len)
+    energies = np.empty(n_frames)
+
+    for first in range(0, n_frames, chunk_frames):
+        chunk = samples[first * frame_len : (first + chunk_frames) * frame_len]
+        n_chunk = min(chunk_frames, n_frames - first)
+        n_full = len(chunk) // frame_len
+        # (frames, channels, samples) so each mean runs over contiguous samples
+        x = chunk[: n_full * frame_len].reshape(n_full, block_size, channels)
+        x = np.ascontiguousarray(x.transpose(0, 2, 1), dtype=np.float64)
+        power = np.mean(x**2, axis=-1)
+        if n_full < n_chunk:
+            # Last, shorter window of the file
+            rest = chunk[n_full * frame_len :].reshape(-1, channels)
+            rest = np.ascontiguousarray(rest.T, dtype=np.float64)
+            power = np.vstack([power, np.mean(rest**2, axis=-1)])
+        rms = np.clip(np.sqrt(power), 1e-10, None)
+        energies[first : first + n_chunk] = (20 * np.log10(rms)).max(axis=1)
+
+    return energies
+
+
+def _tokenize_runs(valid, min_length, max_length, max_continuous_silence):
+    """Yield (start_frame, end_frame) regions from per-window validity flags
+
+    Reproduces auditok's StreamTokenizer (default mode), but steps over runs of
+    equally valid windows instead of one window at a time.
+    """
+    if len(valid) == 0:
+        return
+    edges = np.flatnonzero(valid[1:] != valid[:-1]) + 1
+    bounds = [0, *edges.tolist(), len(valid)]
+
+    active = False  # inside a region (auditok's NOISE or POSSIBLE_SILENCE)
+    contiguous = False  # the previous region was cut at max_length
+    start = length = silence = 0
+
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        if valid[a]:
+            if not active:
+                active = True
+                start = a
+            silence = 0
+            length += b - a
+        elif not active:
+            continue
+        elif max_continuous_silence <= 0:
+            # The first silent window ends the region
+            if length >= min_length or (length > 0 and contiguous):
+                yield start, start + length - 1
+            active = contiguous = False
+            length = 0
+            continue
+        else:
+            # Up to max_continuous_silence silent windows stay in the region
+            silence = min(b - a, max_continuous_silence)
+            length += silence
+
+        while length >= max_length:
+            yield start, start + max_length - 1
+            start += max_length
+            length -= max_length
+            contiguous = True
+
+        if not valid[a] and b - a > max_continuous_silence:
+            if silence < length:
+                if length >= min_length or contiguous:
+                    yield start, start + length - 1
+                contiguous = False
+            active = False
+            length = 0
+
+    if active and length > silence:
+        if length >= min_length or contiguous:
+            yield start, start + length - 1
+
+
+def _window_counts(min_dur, max_dur, max_silence, analysis_window=ANALYSIS_WINDOW):
+    """Convert durations to analysis window counts, with auditok's rounding and checks
+
+    Returns (min_length, max_length, max_continuous_silence).
+    """
+    if min_dur <= 0:
+        raise ValueError(f"'min_dur' ({min_dur}) must be > 0")
+    if max_dur <= 0:
+        raise ValueError(f"'max_dur' ({max_dur}) must be > 0")
+    if max_silence < 0:
+        raise ValueError(f"'max_silence' ({max_silence}) must be >= 0")
+
+    min_length = math.ceil(min_dur / analysis_window)
+    max_length = int(math.floor(max_dur / analysis_window + 1e-10))
+    max_continuous_silence = int(math.floor(max_silence / analysis_window + 1e-10))
+    if min_length > max_length:
+        raise ValueError(f"'min_dur' ({min_dur}) must not be higher than 'max_dur'")
+    if max_continuous_silence >= max_length:
+        raise ValueError(f"'max_silence' ({max_silence}) must be lower than 'max_dur'")
+    return min_length, max_length, max_continuous_silence
+
+
+def _raw_audio(input, **kwargs):
+    """Return (data, sampling_rate, sample_width, channels) for any split input"""
+    if isinstance(input, (str, os.PathLike)):
+        kwargs.pop("large_file", None)
+        input = load(input, **kwargs)
+    if isinstance(input, AudioRegion):
+        return input.data, input.sampling_rate, input.sample_width, input.channels
+    # Raw PCM: bytes or a memory map from PCMCache
+    return (
+        input,
+        kwargs.get("sampling_rate", kwargs.get("sr")),
+        kwargs.get("sample_width", kwargs.get("sw")),
+        kwargs.get("channels", kwargs.get("ch")),
+    )
+
+
+def split_numpy(
+    input,
+    min_dur=0.2,
+    max_dur=5,
+    max_silence=0.3,
+    energy_threshold=50,
+    analysis_window=ANALYSIS_WINDOW,
+    **kwargs,
+):
+    """Split audio into regions like auditok.split, using vectorized energy detection
+
+    Takes the same input and parameters as `split` (raw bytes or a memory map
+    need `sr`, `sw` and `ch`) and yields the same AudioRegion objects. The log
+    energy of all analysis windows is computed with NumPy first, then regions
+    are built from runs of windows above or below `energy_threshold`.
+    """
+    counts = _window_counts(min_dur, max_dur, max_silence, analysis_window)
+    data, sr, sw, ch = _raw_audio(input, **kwargs)
+    block_size = int(analysis_window * sr)
+    valid = frame_energies(data, sw, ch, block_size) >= energy_threshold
+    return _regions_from_tokens(
+        _tokenize_runs(valid, *counts), data, sr, sw, ch, block_size
+    )
+
+
+def _regions_from_tokens(tokens, data, sr, sw, ch, block_size):
+    """Yield an AudioRegion for every (start_frame, end_frame) token"""
+    block_dur = block_size / sr
+    block_bytes = block_size * sw * ch
+    for start, end in tokens:
+        chunk = data[start * block_bytes : (end + 1) * block_bytes]
+        yield AudioRegion(chunk, sr, sw, ch, start * block_dur)
+
+
+def tune_parameters(
+    audio,
+    target_count,
+    min_dur=0.5,
+    max_dur=10,
+    max_silence=0.5,
+    energy_threshold=35,
+    analysis_window=ANALYSIS_WINDOW,
+    threshold_step=0.5,
+):
+    """Find energy_threshold and max_silence values giving `target_count` regions
+
+    The energy of every analysis window is computed once; each candidate pair
+    only compares that envelope with the threshold and counts regions, so a
+    full sweep costs far less than one decode. `max_silence` values closest to
+    the given one are tried first, and among the matches the threshold closest
+    to the given one wins. If no pair gives exactly `target_count` regions, the
+    closest count is used.
+
+    `audio` is an AudioRegion or CachedAudio. Returns
+    (energy_threshold, max_silence, regions_count). Raises ValueError if
+    `target_count` is not positive, as the sweep would then pick parameters
+    that find no speech at all.
+    """
+    if target_count <= 0:
+        raise ValueError(f"Cannot tune for {target_count} regions")
+    min_length, max_length, _ = _window_counts(
+        min_dur, max_dur, max_silence, analysis_window
+    )
+    block_size = int(analysis_window * audio.sampling_rate)
+    energies = frame_energies(
+        audio.data, audio.sample_width, audio.channels, block_size
+    )
+    if len(energies) == 0:
+        return energy_threshold, max_silence, 0
+
+    # Only thresholds between the quietest and loudest windows change anything
+    low, high = np.percentile(energies, [1, 99])
+    low = max(math.floor(low), 0)
+    thresholds = np.arange(low, math.ceil(high) + threshold_step, threshold_step)
+    thresholds = sorted(thresholds, key=lambda t: abs(t - energy_threshold))
+
+    silences = [round(i * analysis_window, 3) for i in range(max_length)]
+    silences = [s for s in silences if s <= max(max_silence, 1.5)]
+    silences.sort(key=lambda s: abs(s - max_silence))
+
+    best = (energy_threshold, max_silence, None)
+    for silence in silences:
+        max_continuous_silence = int(math.floor(silence / analysis_window + 1e-10))
+        for threshold in thresholds:
+            valid = energies >= threshold
+            count = sum(
+                1
+                for _ in _tokenize_runs(
+                    valid, min_length, max_length, max_continuous_silence
+                )
+            )
+            if count == target_count:
+                return float(threshold), silence, count
+            if best[2] is None or abs(count - target_count) < abs(
+                best[2] - target_count
+            ):
+                best = (float(threshold), silence, count)
+    return best
+
+
+SPLIT_BACKENDS = {
+    "auditok": split,
+    "numpy": split_numpy,
+}
+
+
+def _split_window(
+    data, sampling_rate, sample_width, channels, first_frame, backend, params
+):
+    """Segment one window of raw PCM and return its regions as frame ranges
+
+    Runs in a worker process. Only (start_frame, end_frame) pairs, shifted by
+    `first_frame`, are sent back, so region data never crosses processes.
+    """
+    block_size = int(ANALYSIS_WINDOW * sampling_rate)
+    block_dur = block_size / sampling_rate
+    block_bytes = block_size * sample_width * channels
+    tokens = []
+    for region in SPLIT_BACKENDS[backend](
+        data,
+        sr=sampling_rate,
+        sw=sample_width,
+        ch=channels,
+        analysis_window=ANALYSIS_WINDOW,
+        **params,
+    ):
+        start = round(region.meta.start / block_dur)
+        length = math.ceil(len(region.data) / block_bytes)
+        tokens.append((first_frame + start, first_frame + start + length - 1))
+    return tokens
+
+
+def _find_stitch(tokens, next_tokens, last_frame):
+    """Return the index in `tokens` of the first region also found by the next window
+
+    Once both windows have emitted the same region, their detectors are in the
+    same state, so everything after it can be taken from the next window. Regions
+    touching `last_frame` may have been cut by the end of the window and are not
+    used.
+    """
+    shared = set(next_tokens)
+    for i, token in enumerate(tokens):
+        if token[1] >= last_frame:
+            break
+        if token in shared:
+            return i
+    return None
+
+
+def _map_in_order(executor, fn, args_list, limit):
+    """Results of fn(*args) for each args, in order, with at most `limit` queued
+
+    The next call is only submitted when the oldest one has finished, so the
+    arguments of the calls not yet made are not held in memory.
+    """
+    futures = deque()
+    for args in args_list:
+        if len(futures) >= limit:
+            yield futures.popleft().result()
+        futures.append(executor.submit(fn, *args))
+    while futures:
+        yield futures.popleft().result()
+
+
+def split_parallel(
+    audio_file,
+    min_dur=0.5,
+    max_dur=10,
+    max_silence=0.5,
+    energy_threshold=35,
+    workers=None,
+    window=600,
+    overlap=None,
+    backend="auditok",
+    cache=None,
+    audio=None,
+):
+    """Split an audio file into regions using several processes
+
+    The decoded audio is cut into `window`-second chunks that overlap their
+    neighbours by `overlap` seconds on each side. Every chunk is segmented
+    with the `backend` splitter in a process pool, and neighbouring results
+    are joined on the first region both chunks agree on, which gives the same
+    regions as a single `split` over the whole file. If two chunks share no
+    region (for instance a silence longer than the overlap), they are
+    segmented again as one chunk.
+
+    With a PCMCache as `cache`, the decoded audio is memory-mapped from the
+    cache instead of decoding the file again. Audio already decoded (an
+    AudioRegion or CachedAudio, as after tuning) can be passed as `audio`.
+
+    Returns a generator of AudioRegion, like `split`.
+    """
+    if overlap is None:
+        overlap = max(60, 4 * max_dur)
+    params = dict(
+        min_dur=min_dur,
+        max_dur=max_dur,
+        max_silence=max_silence,
+        energy_threshold=energy_threshold,
+    )
+
+    if audio is None:
+        audio = cache.load(audio_file) if cache is not None else load(audio_file)
+    data = audio.data
+    sr, sw, ch = audio.sampling_rate, audio.sample_width, audio.channels
+    block_size = int(ANALYSIS_WINDOW * sr)
+    block_dur = block_size / sr
+    block_bytes = block_size * sw * ch
+    total_frames = math.ceil(len(data) / block_bytes)
+
+    window_frames = max(1, int(window / block_dur))
+    overlap_frames = math.ceil(overlap / block_dur)
+    spans = []
+    for first in range(0, total_frames, window_frames):
+        start = max(0, first - overlap_frames)
+        end = min(total_frames, first + window_frames + overlap_frames)
+        spans.append((start, end))
+    if not spans:
+        # Empty audio, nothing to split
+        return _regions_from_tokens([], data, sr, sw, ch, block_size)
+
+    def window_args(span):
+        start, end = span
+        chunk = data[start * block_bytes : end * block_bytes]
+        return chunk, sr, sw, ch, start, backend, params
+
+    # Windows are sliced only shortly before a worker needs them, so the
+    # copies sent to the pool do not add up to a second copy of the audio
+    limit = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = _map_in_order(executor, _split_window, map(window_args, spans), limit)
+        # Regions already final, and the live window they are continued from
+        merged = []
+        live_span = spans[0]
+        live = next(results)
+        for span, next_tokens in zip(spans[1:], results):
+            stitch = _find_stitch(live, next_tokens, live_span[1] - 1)
+            if stitch is None:
+                # Nothing shared in the overlap, redo both windows as one
+                live_span = (live_span[0], span[1])
+                redone = _split_window(*window_args(live_span))
+                last = merged[-1] if merged else None
+                live = [token for token in redone if last is None or token > last]
+                continue
+            merged.extend(live[: stitch + 1])
+            stitch_token = live[stitch]
+            live = [token for token in next_tokens if token > stitch_token]
+            live_span = span
+    merged.extend(live)
+
+    return _regions_from_tokens(merged, data, sr, sw, ch, block_size)
+
 
 def process_audio(
     audio_file,
@@ -60,7 +490,57 @@ def process_audio(
     max_dur=10,
     max_silence=0.5,
     energy_threshold=35,
+    stream=False,
+    workers=1,
+    backend="auditok",
+    cache=None,
+    auto_tune=False,
+    record_params=False,
+    timer=None,
+    profile_dir=None,
+    metrics_file=None,
+    formats=("srt",),
+    subtitles=None,
 ):
+    """Split an audio file into speech regions and write them as an SRT file
+
+    With `stream=True` regions are read from the splitter one at a time and each
+    cue is written as soon as it is found, so memory does not grow with the
+    number of regions. WAV and raw input is then also read from disk lazily.
+
+    With `workers` > 1 the file is segmented by `split_parallel` on that many
+    processes, also after auto-tuning. The result is the same as with a
+    single process.
+
+    `backend` picks the splitter from SPLIT_BACKENDS: "auditok" (default) or
+    "numpy", which finds the same regions with vectorized energy detection.
+
+    With a PCMCache as `cache`, the file is decoded only the first time and
+    later runs (for example with another `energy_threshold`) read the decoded
+    samples from the cache.
+
+    With `auto_tune=True`, `energy_threshold` and `max_silence` are adjusted by
+    `tune_parameters` until the number of regions equals the number of lines in
+    subtitle.txt. The values used are printed and recorded next to the SRT
+    file (see generate_srt).
+    `record_params=True` records them without tuning. Without subtitle lines
+    there is nothing to tune for, and the given parameters are used.
+
+    Wall and CPU time of each stage (decode, subtitles, tune, segmentation,
+    write) are recorded in `timer`, a StageTimer whose callbacks see every stage
+    as it ends. With workers, decoding is part of segmentation and CPU time of
+    the worker processes is not counted. `profile_dir` saves a cProfile dump of
+    the run as <audio name>.prof, and `metrics_file` gets one JSON line with
+    the timings and results of the run.
+
+    `formats` chooses the subtitle files written in the same pass, from "srt"
+    (to `output_file`), "vtt" and "json" (next to it).
+
+    `subtitles` are the cue texts; by default they are read from subtitle.txt
+    in the current directory. Pass [] to use the 'xxx' placeholder.
+
+    Returns the number of regions written.
+    """
     # Determine output file path
     if output_file is None:
         base_name = os.path.splitext(audio_file)[0]
@@ -71,31 +551,520 @@ def process_audio(
     print(f"Max duration: {max_dur}s")
     print(f"Max silence: {max_silence}s")
     print(f"Energy threshold: {energy_threshold}")
+    print(f"Backend: {backend}")
 
-    # Split audio
-    audio_regions = list(
-        split(
-            audio_file,
-            min_dur=min_dur,
-            max_dur=max_dur,
-            max_silence=max_silence,
-            energy_threshold=energy_threshold,
-        )
+    split_fn = SPLIT_BACKENDS[backend]
+    split_params = dict(
+        min_dur=min_dur,
+        max_dur=max_dur,
+        max_silence=max_silence,
+        energy_threshold=energy_threshold,
     )
+    if timer is None:
+        timer = StageTimer()
+    profile_file = None
+    if profile_dir is not None:
+        name = os.path.splitext(os.path.basename(audio_file))[0]
+        profile_file = os.path.join(profile_dir, f"{name}.prof")
+
+    # auditok can only read wav and raw files lazily
+    lazy = (
+        stream
+        and workers == 1
+        and cache is None
+        and not auto_tune
+        and os.path.splitext(audio_file)[1].lower() in (".wav", ".raw")
+    )
+
+    with profiled(profile_file):
+        with timer.stage("subtitles"):
+            if subtitles is None:
+                subtitles = load_subtitles()
+
+        audio = None
+        if workers == 1 and not lazy:
+            with timer.stage("decode"):
+                if cache is not None:
+                    audio = cache.load(audio_file)
+                else:
+                    audio = load(audio_file)
+
+        if auto_tune and not subtitles:
+            print("No subtitle lines to tune for, auto-tune skipped")
+            auto_tune = False
+        if auto_tune:
+            with timer.stage("tune"):
+                if audio is None:
+                    audio = cache.load(audio_file) if cache else load(audio_file)
+                energy_threshold, max_silence, tuned_count = tune_parameters(
+                    audio, len(subtitles), **split_params
+                )
+            split_params.update(
+                energy_threshold=energy_threshold, max_silence=max_silence
+            )
+            print(
+                f"Auto-tuned: energy threshold {energy_threshold}, max silence {max_silence}s "
+                f"({tuned_count} regions for {len(subtitles)} subtitle lines)"
+            )
+
+        with timer.stage("segmentation"):
+            if workers > 1:
+                print(f"Workers: {workers}")
+                # Audio loaded for tuning is split as it is
+                regions = split_parallel(
+                    audio_file,
+                    workers=workers,
+                    backend=backend,
+                    cache=cache,
+                    audio=audio,
+                    **split_params,
+                )
+            elif audio is not None:
+                # auditok only reads from bytes, the numpy backend reads a map directly
+                data = audio.data if backend == "numpy" else bytes(audio.data)
+                regions = split_fn(
+                    data,
+                    sr=audio.sampling_rate,
+                    sw=audio.sample_width,
+                    ch=audio.channels,
+                    **split_params,
+                )
+            else:
+                regions = split_fn(audio_file, large_file=True, **split_params)
+        regions = timer.timed_iter(regions, "segmentation")
+
+        srt_params = split_params if auto_tune or record_params else None
+
+        if stream:
+            stats = {"total": 0.0, "longest": 0.0}
+
+            def report_region(i, region):
+                stats["total"] += region.duration
+                stats["longest"] = max(stats["longest"], region.duration)
+                print(
+                    f"Region {i+1}: {region.meta.start:.3f}s - {region.meta.end:.3f}s = {region.duration:.3f}s"
+                )
+
+            with timer.stage("write"):
+                regions_count = generate_srt(
+                    regions,
+                    output_file,
+                    on_region=report_region,
+                    params=srt_params,
+                    subtitles=subtitles,
+                    formats=formats,
+                )
+            print(f"Found {regions_count} audio segments")
+            if regions_count:
+                print(
+                    f"Total speech: {stats['total']:.3f}s, average: {stats['total'] / regions_count:.3f}s, longest: {stats['longest']:.3f}s"
+                )
+        else:
+            # Split audio
+            audio_regions = list(regions)
+            regions_count = len(audio_regions)
+
+            # Print segmentation info
+            print(f"Found {regions_count} audio segments")
+            for i, region in enumerate(audio_regions):
+                print(
+                    f"Region {i+1}: {region.meta.start:.3f}s - {region.meta.end:.3f}s = {region.duration:.3f}s"
+                )
+
+            # Generate SRT file
+            with timer.stage("write"):
+                generate_srt(
+                    audio_regions,
+                    output_file,
+                    params=srt_params,
+                    subtitles=subtitles,
+                    formats=formats,
+                )
+
+    print(f"SRT file saved to: {output_file}")
+    for line in timer.summary():
+        print(f"Timing - {line}")
+    if profile_file is not None:
+        print(f"Profile saved to: {profile_file}")
+
+    if metrics_file is not None:
+        wall, cpu = timer.total()
+        record = {
+            "file": audio_file,
+            "output": output_file,
+            "time": int(time.time()),
+            "params": split_params,
+            "backend": backend,
+            "workers": workers,
+            "stream": stream,
+            "regions": regions_count,
+            "stages": timer.stages,
+            "wall": wall,
+            "cpu": cpu,
+        }
+        if audio is not None:
+            record["audio_seconds"] = len(audio.data) / (
+                audio.sampling_rate * audio.sample_width * audio.channels
+            )
+        append_metrics(metrics_file, record)
+
+    return regions_count
+
+
+def parse_time(value):
+    """Parse a time given as seconds or as [HH:]MM:SS[.mmm] into seconds"""
+    if ":" not in value:
+        return float(value)
+    seconds = 0.0
+    for part in value.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def _load_range(audio_file, start, end, cache=None):
+    """Decode `audio_file` from `start` to `end` seconds as an AudioRegion
+
+    With a PCMCache the range is sliced from the cached samples. Otherwise
+    WAV and raw files are read from `start` on only, MP3 files are decoded
+    only over the frames of the range (found with their MP3Index), and other
+    compressed files still have to be decoded up to `end`.
+    """
+    if cache is None and audio_file.lower().endswith(".mp3"):
+        return _load_mp3_range(audio_file, start, end)
+    if cache is None:
+        return load(audio_file, skip=start, max_read=end - start)
+    audio = cache.load(audio_file)
+    frame_bytes = audio.sample_width * audio.channels
+    first = round(start * audio.sampling_rate) * frame_bytes
+    last = round(end * audio.sampling_rate) * frame_bytes
+    return AudioRegion(
+        bytes(audio.data[first:last]),
+        audio.sampling_rate,
+        audio.sample_width,
+        audio.channels,
+    )
+
+
+def _load_mp3_range(audio_file, start, end):
+    """Decode `start`-`end` seconds of an MP3 file from its frames alone"""
+    # pydub is what auditok decodes compressed files with
+    from pydub import AudioSegment
+
+    index = load_index(audio_file)
+    data, _, last_frame = index.read_frames(audio_file, start, end)
+    segment = AudioSegment.from_file(io.BytesIO(data), format="mp3")
+    sr, sw, ch = segment.frame_rate, segment.sample_width, segment.channels
+    frame_bytes = sw * ch
+    first, last = index.trim(
+        start, end, last_frame, len(segment.raw_data) // frame_bytes, sr
+    )
+    return AudioRegion(
+        segment.raw_data[first * frame_bytes : last * frame_bytes], sr, sw, ch
+    )
+
+
+def resegment_range(
+    audio_file,
+    start,
+    end,
+    srt_file=None,
+    output_file=None,
+    min_dur=0.5,
+    max_dur=10,
+    max_silence=0.5,
+    energy_threshold=35,
+    backend="auditok",
+    cache=None,
+    formats=("srt",),
+):
+    """Split only `start`-`end` seconds of `audio_file` again and patch its SRT file
+
+    The cues of `srt_file` inside the range are replaced by the regions found
+    there with the new parameters; cues outside it keep their times and their
+    (possibly edited) text. A cue crossing a range boundary widens the range to
+    include it. The texts of the replaced cues are given to the new regions in
+    order, extra regions get "xxx". The cues are renumbered and written to
+    `output_file` (default: `srt_file`, which defaults to the SRT next to the
+    audio), together with every other format in `formats` or already next to
+    it, so no WebVTT or JSON copy keeps the old cues.
+
+    The recorded parameters of the original file are kept only if the range
+    was split with the same ones. Otherwise the file no longer matches any
+    single set of parameters, so none are recorded and directory mode treats
+    it as out of date.
+
+    Returns the number of regions found in the range.
+    """
+    if srt_file is None:
+        srt_file = f"{os.path.splitext(audio_file)[0]}.srt"
+    if output_file is None:
+        output_file = srt_file
+    if end <= start:
+        raise ValueError(f"Empty range: {start}s - {end}s")
+
+    cues = read_srt(srt_file)
+    params = read_params(srt_file)
+
+    # Widen the range so that no cue is cut in two
+    for cue_start, cue_end, _ in cues:
+        if cue_start < end and cue_end > start:
+            start, end = min(start, cue_start), max(end, cue_end)
+    before = [cue for cue in cues if cue[1] <= start]
+    inside = [cue for cue in cues if cue[0] < end and cue[1] > start]
+    after = [cue for cue in cues if cue[0] >= end]
+    print(f"Re-segmenting {audio_file} from {start:.3f}s to {end:.3f}s")
 
-    # Print segmentation info
-    print(f"Found {len(audio_regions)} audio segments")
-    for i, region in enumerate(audio_regions):
+    audio = _load_range(audio_file, start, end, cache)
+    split_fn = SPLIT_BACKENDS[backend]
+    split_params = dict(
+        min_dur=min_dur,
+        max_dur=max_dur,
+        max_silence=max_silence,
+        energy_threshold=energy_threshold,
+    )
+    regions = split_fn(audio, **split_params)
+    texts = [text for _, _, text in inside]
+    new_cues = []
+    for i, region in enumerate(regions):
+        text = texts[i] if i < len(texts) else "xxx"
+        new_cues.append((start + region.meta.start, start + region.meta.end, text))
+
+    print(f"Replaced {len(inside)} cues with {len(new_cues)} regions")
+    if len(texts) > len(new_cues):
         print(
-            f"Region {i+1}: {region.meta.start:.3f}s - {region.meta.end:.3f}s = {region.duration:.3f}s"
+            f"Too many subtitles: {len(texts) - len(new_cues)} cue texts in the range unused"
         )
 
-    # Generate SRT file
-    generate_srt(audio_regions, output_file)
-    print(f"SRT file saved to: {output_file}")
+    if params and params != split_params:
+        print("The range used other parameters, recorded parameters removed")
+        params = None
+
+    base_name = os.path.splitext(output_file)[0]
+    paths = {
+        fmt: output_file if fmt == "srt" else base_name + extension
+        for fmt, extension in FORMAT_EXTENSIONS.items()
+    }
+    # Existing copies in other formats would keep the old cues
+    outputs = {
+        fmt: path
+        for fmt, path in paths.items()
+        if fmt in formats or os.path.exists(path)
+    }
+    with SubtitleWriter(outputs, params) as writer:
+        for cue in before + new_cues + after:
+            writer.add(*cue)
+    print(f"SRT file saved to: {output_file} ({writer.count} cues)")
+
+    return len(new_cues)
+
+
+def is_up_to_date(audio_file, srt_file, params):
+    """Whether `srt_file` is newer than `audio_file` and was made with `params`"""
+    if not os.path.exists(srt_file):
+        return False
+    if os.path.getmtime(srt_file) < os.path.getmtime(audio_file):
+        return False
+    return read_params(srt_file) == params
+
+
+def find_audio_files(directory):
+    """All audio files under `directory`, in a stable order"""
+    audio_files = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            if file.lower().endswith(AUDIO_EXTENSIONS):
+                audio_files.append(os.path.join(root, file))
+    return audio_files
+
+
+def _process_one(audio_file, params, options):
+    """Batch worker: run process_audio quietly and report the outcome
+
+    The cue texts come from <audio name>.txt next to the file if there is one,
+    never from the shared subtitle.txt; without it every cue is 'xxx'.
+    Returns (audio_file, regions_count, seconds, error).
+    """
+    start = time.perf_counter()
+    try:
+        # Keep the per-region output of many workers out of the console
+        with contextlib.redirect_stdout(io.StringIO()):
+            subtitles = load_subtitles(f"{os.path.splitext(audio_file)[0]}.txt")
+            regions_count = process_audio(
+                audio_file,
+                stream=True,
+                record_params=True,
+                subtitles=subtitles,
+                **params,
+                **options,
+            )
+        return audio_file, regions_count, time.perf_counter() - start, None
+    except Exception as e:
+        return audio_file, 0, time.perf_counter() - start, str(e)
+
+
+def process_directory(directory, jobs=None, force=False, options=None, **params):
+    """Generate SRT files for every audio file under `directory` in a process pool
+
+    Files whose SRT is newer than the audio and was made with the same
+    parameters are skipped unless `force` is set. `options` are extra
+    process_audio arguments that do not change the detection (backend, cache,
+    formats, metrics_file, profile_dir).
+    Returns a dict of counts for the summary.
+    """
+    options = options or {}
+    stats = {"processed": 0, "skipped": 0, "failed": 0, "regions": 0, "total": 0}
+
+    pending = []
+    for audio_file in find_audio_files(directory):
+        stats["total"] += 1
+        srt_file = f"{os.path.splitext(audio_file)[0]}.srt"
+        if not force and is_up_to_date(audio_file, srt_file, params):
+            stats["skipped"] += 1
+            continue
+        pending.append(audio_file)
+
+    print(
+        f"{stats['total']} audio files, {stats['skipped']} up to date, {len(pending)} to process"
+    )
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_process_one, audio_file, params, options)
+            for audio_file in pending
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            audio_file, regions_count, seconds, error = future.result()
+            if error is None:
+                stats["processed"] += 1
+                stats["regions"] += regions_count
+                print(
+                    f"[{done}/{len(pending)}] {audio_file}: {regions_count} regions in {seconds:.1f}s"
+                )
+            else:
+                stats["failed"] += 1
+                print(f"[{done}/{len(pending)}] {audio_file}: failed: {error}")
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Detect speech segments in audio files and write SRT subtitles"
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default="Section 3.mp3",
+        help="Audio file, or a directory to process every audio file in it",
+    )
+    parser.add_argument("--min-dur", type=float, default=0.5)
+    parser.add_argument("--max-dur", type=float, default=10)
+    parser.add_argument("--max-silence", type=float, default=0.5)
+    parser.add_argument("--energy-threshold", type=float, default=35)
+    parser.add_argument("--backend", choices=sorted(SPLIT_BACKENDS), default="auditok")
+    parser.add_argument(
+        "--auto-tune",
+        action="store_true",
+        help="Adjust energy threshold and max silence to give one segment per line of subtitle.txt",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Files processed at once in directory mode (default: CPU count)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes splitting a single audio file in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Also redo up-to-date SRT files"
+    )
+    parser.add_argument(
+        "--cache", action="store_true", help="Keep decoded audio in the PCM cache"
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=sorted(FORMAT_EXTENSIONS),
+        default=["srt"],
+        help="Subtitle files to write next to each audio file",
+    )
+    parser.add_argument(
+        "--metrics", help="Append a JSON line with stage timings per file to this file"
+    )
+    parser.add_argument(
+        "--profile-dir", help="Save a cProfile dump per file in this directory"
+    )
+    parser.add_argument(
+        "--resegment",
+        nargs=2,
+        type=parse_time,
+        metavar=("START", "END"),
+        help="Only split this range again (seconds or HH:MM:SS) and patch the SRT file",
+    )
+    parser.add_argument("--srt", help="SRT file patched by --resegment")
+    args = parser.parse_args()
+
+    params = dict(
+        min_dur=args.min_dur,
+        max_dur=args.max_dur,
+        max_silence=args.max_silence,
+        energy_threshold=args.energy_threshold,
+    )
+    options = dict(
+        backend=args.backend,
+        formats=args.formats,
+        metrics_file=args.metrics,
+        profile_dir=args.profile_dir,
+    )
+    if args.cache:
+        from pcm_cache import PCMCache
+
+        options["cache"] = PCMCache()
+
+    if args.auto_tune and (args.resegment or os.path.isdir(args.path)):
+        # subtitle.txt holds the lines of one recording
+        parser.error("--auto-tune works on a single audio file")
+    if args.workers != 1 and (args.resegment or os.path.isdir(args.path)):
+        # Directory mode already runs one file per process (--jobs)
+        parser.error("--workers works on a single audio file")
+
+    if args.resegment:
+        start, end = args.resegment
+        resegment_range(
+            args.path,
+            start,
+            end,
+            srt_file=args.srt,
+            backend=args.backend,
+            cache=options.get("cache"),
+            formats=args.formats,
+            **params,
+        )
+        return 0
+
+    if not os.path.isdir(args.path):
+        process_audio(
+            args.path,
+            auto_tune=args.auto_tune,
+            workers=args.workers,
+            **params,
+            **options,
+        )
+        return 0
+
+    start = time.perf_counter()
+    stats = process_directory(args.path, args.jobs, args.force, options, **params)
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+    print(f"Processed: {stats['processed']} files, {stats['regions']} regions")
+    print(f"Skipped (up to date): {stats['skipped']} files")
+    print(f"Failed: {stats['failed']} files")
+    return 1 if stats["failed"] else 0
 
 
 if __name__ == "__main__":
-    # Execute with default parameters
-    audio_file = r"Section 3.mp3"  # Replace with your audio file path
-    process_audio(audio_file)
+    sys.exit(main())
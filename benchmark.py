@@ -0,0 +1,892 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import wave
+import argparse
+import platform
+import tracemalloc
+import tempfile
+import contextlib
+import multiprocessing
+import numpy as np
+from auditok import AudioRegion, load
+
+from audio_to_srt import SPLIT_BACKENDS, generate_srt, format_timestamp
+from subtitle_writer import format_ms, load_cues
+from instrumentation import Histogram, git_version
+from audio_concat import concatenate_files
+from mp3_index import scan_mp3
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PIPELINE_LENGTHS = [60, 600, 1800]
+PIPELINE_FORMATS = [(16000, 1), (44100, 2)]
+PIPELINE_PARAMS = dict(min_dur=0.5, max_dur=10, max_silence=0.5, energy_threshold=35)
+# Navigation scripts of the playback benchmark, with the pause between keys
+PLAYBACK_SCRIPTS = {
+    "dictation": 0.3,  # next, then replay twice, as while writing a sentence down
+    "skim": 0.01,  # next as fast as possible, outrunning the prefetch
+    "review": 0.05,  # previous from the end back to the start
+    "jump": 0.05,  # random segments, as when clicking through the recent files
+}
+CONCAT_COUNTS = [100, 1000, 3000]
+
+
+def synthetic_speech(seconds, sampling_rate=16000, channels=1, seed=0):
+    """Generate deterministic speech-like audio as raw 16-bit PCM
+
+    Tone bursts of random length, pitch and loudness are separated by random
+    gaps of near silence, with a little background noise everywhere.
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = int(seconds * sampling_rate)
+    signal = rng.normal(0, 3, n_samples)
+
+    t = rng.uniform(0.1, 1.0)
+    while t < seconds:
+        duration = rng.uniform(0.2, 6.0)
+        start = int(t * sampling_rate)
+        end = min(int((t + duration) * sampling_rate), n_samples)
+        n = np.arange(end - start)
+        pitch = rng.uniform(120, 400)
+        burst = np.sin(2 * np.pi * pitch * n / sampling_rate)
+        # Slow amplitude wobble so energy crosses the threshold now and then
+        burst *= 0.6 + 0.4 * np.sin(2 * np.pi * rng.uniform(1, 5) * n / sampling_rate)
+        signal[start:end] += rng.uniform(300, 12000) * burst
+        t += duration + rng.uniform(0.05, 2.0)
+
+    pcm = np.clip(signal, -32768, 32767).astype(np.int16)
+    return np.repeat(pcm[:, None], channels, axis=1).tobytes()
+
+
+def region_times(regions):
+    return [(round(r.meta.start, 6), round(r.meta.end, 6)) for r in regions]
+
+
+def bench_backends(args):
+    """Check that every backend finds the same regions, and compare their speed"""
+    param_sets = [
+        dict(min_dur=0.5, max_dur=10, max_silence=0.5, energy_threshold=35),
+        dict(min_dur=0.2, max_dur=5, max_silence=0.3, energy_threshold=50),
+        dict(min_dur=0.3, max_dur=2, max_silence=0, energy_threshold=60),
+        dict(min_dur=1.0, max_dur=3, max_silence=1.0, energy_threshold=70),
+    ]
+    failures = 0
+
+    for sr, ch in [(16000, 1), (22050, 1), (44100, 2)]:
+        data = synthetic_speech(args.seconds, sr, ch, seed=args.seed)
+        audio = AudioRegion(data, sr, 2, ch)
+        print(f"\n{args.seconds}s of audio at {sr} Hz, {ch} channel(s)")
+
+        for params in param_sets:
+            results = {}
+            for name, split_fn in SPLIT_BACKENDS.items():
+                start = time.perf_counter()
+                results[name] = region_times(split_fn(audio, **params))
+                elapsed = time.perf_counter() - start
+                print(
+                    f"  {name:>8}: {len(results[name]):5d} regions, "
+                    f"{elapsed:.3f}s, {args.seconds / elapsed:.0f}x realtime  {params}"
+                )
+
+            reference = results["auditok"]
+            for name, regions in results.items():
+                if regions != reference:
+                    failures += 1
+                    print(f"  MISMATCH: {name} differs from auditok")
+
+    print("\nAll backends match" if not failures else f"\n{failures} mismatches")
+    return 1 if failures else 0
+
+
+def write_wav(path, data, sampling_rate, channels):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sampling_rate)
+        w.writeframes(data)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_pipeline_case(seconds, sampling_rate, channels, backend, seed):
+    """Time decode, split and SRT writing for one synthetic file
+
+    The audio is stored as WAV, so no encoder is needed to run the benchmark.
+    Runs in a fresh process so the peak RSS belongs to this case alone.
+    """
+    data = synthetic_speech(seconds, sampling_rate, channels, seed=seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        audio_file = os.path.join(tmp_dir, "bench.wav")
+        srt_file = os.path.join(tmp_dir, "bench.srt")
+        write_wav(audio_file, data, sampling_rate, channels)
+        del data
+        stages = {}
+
+        start = time.perf_counter()
+        audio = load(audio_file)
+        stages["decode"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        regions = list(SPLIT_BACKENDS[backend](audio, **PIPELINE_PARAMS))
+        stages["split"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_srt(regions, srt_file)
+        stages["write"] = time.perf_counter() - start
+
+    total = sum(stages.values())
+    return {
+        "seconds": seconds,
+        "sampling_rate": sampling_rate,
+        "channels": channels,
+        "backend": backend,
+        "regions": len(regions),
+        "stages": stages,
+        "total": total,
+        "speed": seconds / total,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def time_format_timestamp(calls=200000):
+    """format_timestamp calls per second"""
+    values = np.random.default_rng(0).uniform(0, 36000, calls).tolist()
+    start = time.perf_counter()
+    for value in values:
+        format_timestamp(value)
+    return calls / (time.perf_counter() - start)
+
+
+def bench_pipeline(args):
+    """Measure the segmentation pipeline stage by stage and save the results as JSON"""
+    cases = []
+    # One process per case, so every case starts with a clean peak RSS
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        for seconds in args.lengths:
+            for sampling_rate, channels in PIPELINE_FORMATS:
+                for backend in args.backends:
+                    case = pool.apply(
+                        run_pipeline_case,
+                        (seconds, sampling_rate, channels, backend, args.seed),
+                    )
+                    cases.append(case)
+                    stages = case["stages"]
+                    line = (
+                        f"{seconds:6.0f}s {sampling_rate:5d} Hz x{channels} {backend:>8}: "
+                        f"decode {stages['decode']:.3f}s, split {stages['split']:.3f}s, "
+                        f"write {stages['write']:.3f}s, {case['speed']:.0f} audio s/s"
+                    )
+                    if case["peak_rss_mb"] is not None:
+                        line += f", peak RSS {case['peak_rss_mb']:.0f} MB"
+                    print(line)
+
+    timestamps_per_second = time_format_timestamp()
+    print(f"format_timestamp: {timestamps_per_second:.0f} calls/s")
+
+    results = {
+        "version": git_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": PIPELINE_PARAMS,
+        "format_timestamp_per_second": timestamps_per_second,
+        "cases": cases,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to: {args.output}")
+    return 0
+
+
+def case_key(case):
+    return (case["seconds"], case["sampling_rate"], case["channels"], case["backend"])
+
+
+def compare_results(args):
+    """Compare two pipeline result files and flag slower or larger cases"""
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    print(f"Baseline: {baseline.get('version')}, current: {current.get('version')}")
+
+    old_cases = {case_key(case): case for case in baseline["cases"]}
+    regressions = 0
+    for case in current["cases"]:
+        old = old_cases.get(case_key(case))
+        if old is None:
+            continue
+        changes = {"speed": old["speed"] / case["speed"] - 1}
+        if old.get("peak_rss_mb") and case.get("peak_rss_mb"):
+            changes["peak RSS"] = case["peak_rss_mb"] / old["peak_rss_mb"] - 1
+        for stage, seconds in case["stages"].items():
+            if old["stages"].get(stage):
+                changes[stage] = seconds / old["stages"][stage] - 1
+
+        worse = {
+            name: change for name, change in changes.items() if change > args.tolerance
+        }
+        label = "{0:.0f}s {1} Hz x{2} {3}".format(*case_key(case))
+        if worse:
+            regressions += 1
+            details = ", ".join(
+                f"{name} +{change:.0%}" for name, change in worse.items()
+            )
+            print(f"REGRESSION {label}: {details}")
+        else:
+            print(f"ok         {label}: speed {case['speed']:.0f} audio s/s")
+
+    print(f"{regressions} regressions" if regressions else "No regressions")
+    return 1 if regressions else 0
+
+
+def write_synthetic_srt(path, cues, newline="\n"):
+    """Write an SRT file with `cues` cues of one or two text lines"""
+    with open(path, "w", encoding="utf-8", newline=newline) as f:
+        for i in range(cues):
+            start = i * 3000
+            text = f"Sentence number {i}" if i % 3 else f"Line one {i}\nline two"
+            f.write(
+                f"{i + 1}\n{format_ms(start)} --> {format_ms(start + 2500)}\n{text}\n\n"
+            )
+
+
+def regex_parse_srt(srt_file):
+    """The previous whole-file regex parser of the dictation helper, for reference"""
+    with open(srt_file, "r", encoding="utf-8") as f:
+        content = f.read()
+    pattern = r"(\d+)\n(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})\n([\s\S]*?)(?=\n\n\d+\n|$)"
+
+    def seconds(time_str):
+        hours, minutes, secs = time_str.replace(",", ".").split(":")
+        return float(hours) * 3600 + float(minutes) * 60 + float(secs)
+
+    return [
+        {
+            "index": int(index),
+            "start": seconds(start),
+            "end": seconds(end),
+            "text": text.strip(),
+        }
+        for index, start, end, text in re.findall(pattern, content)
+    ]
+
+
+def measure(func, *args):
+    """Run `func` and return (result, seconds, peak allocated memory in MB)
+
+    The time is taken on an untraced run, as tracemalloc slows allocation down.
+    """
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = func(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 1024**2
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def measure_once(func, *args):
+    """Like measure, but a single run, timed while traced
+
+    For slow functions that allocate a few large buffers, where tracing adds
+    little and running twice would double a long wait.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024**2
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_srt(args):
+    """Time and measure the memory of SRT parsing on large synthetic files"""
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for newline in ("\n", "\r\n"):
+            srt_file = os.path.join(tmp_dir, "bench.srt")
+            write_synthetic_srt(srt_file, args.cues, newline)
+            label = "CRLF" if newline == "\r\n" else "LF"
+            print(f"\n{args.cues} cues, {label} line ends")
+
+            table, elapsed, peak = measure(load_cues, srt_file)
+            print(
+                f"  streaming: {len(table):7d} cues, {elapsed:.3f}s, peak {peak:.1f} MB"
+            )
+            if len(table) != args.cues:
+                failures += 1
+                print(f"  MISMATCH: streaming parser found {len(table)} cues")
+
+            segments, elapsed, peak = measure(regex_parse_srt, srt_file)
+            print(
+                f"  regex:     {len(segments):7d} cues, {elapsed:.3f}s, peak {peak:.1f} MB"
+            )
+            if newline == "\n":
+                expected = [(s["start"], s["end"], s["text"]) for s in segments]
+                if list(table) != expected:
+                    failures += 1
+                    print("  MISMATCH: streaming and regex parsers differ")
+
+    print("\nParsers agree" if not failures else f"\n{failures} mismatches")
+    return 1 if failures else 0
+
+
+def navigation_script(name, cues, steps, seed=0):
+    """Operations of a playback script as (operation, argument) pairs"""
+    if name == "dictation":
+        ops = []
+        while len(ops) < steps:
+            ops += [("next", 1), ("replay", None), ("replay", None)]
+        return ops[:steps]
+    if name == "skim":
+        return [("next", 1)] * steps
+    if name == "review":
+        return [("jump", cues - 1)] + [("previous", -1)] * (steps - 1)
+    rng = np.random.default_rng(seed)
+    return [("jump", int(i)) for i in rng.integers(0, cues, steps)]
+
+
+def run_playback_script(session, ops, think):
+    """Run the operations, ticking the session when it asks to, like the UI timer
+
+    Returns {operation: Histogram} of the time from the key press to the
+    sound being audible (hand-off to the output plus its buffer latency).
+    """
+    latency = {}
+    for op, arg in ops:
+        pressed = time.perf_counter()
+        if op == "jump":
+            session.play(arg, pressed)
+        elif op == "replay":
+            session.replay(pressed)
+        else:
+            session.navigate(arg, pressed)
+        audible = time.perf_counter() + session.output.latency()
+        latency.setdefault(op, Histogram()).add(audible - pressed)
+        while True:
+            remaining = pressed + think - time.perf_counter()
+            if remaining <= 0:
+                break
+            delay = session.next_tick()
+            time.sleep(remaining if delay is None else min(delay, remaining))
+            session.tick()
+    return latency
+
+
+def bench_playback(args):
+    """Run scripted navigation against a headless playback session
+
+    Uses SDL's dummy audio driver (the real pygame mixer, no sound device) or
+    a null sink that only times the clips. Each script runs twice on a fresh
+    session: untraced for latency, then under tracemalloc for memory.
+    """
+    if args.output == "dummy":
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+    # pygame is only needed by this benchmark
+    from pcm_cache import PCMCache
+    from clip_cache import ClipCache
+    from playback_session import PlaybackSession, PygameOutput, NullOutput
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        audio_file = os.path.join(tmp_dir, "bench.wav")
+        srt_file = os.path.join(tmp_dir, "bench.srt")
+        write_wav(audio_file, synthetic_speech(args.seconds, 44100, 2), 44100, 2)
+        cues = int(args.seconds // 3)
+        write_synthetic_srt(srt_file, cues)
+        segments = load_cues(srt_file)
+        pcm_cache = PCMCache(os.path.join(tmp_dir, "pcm"))
+
+        def open_session():
+            output = PygameOutput() if args.output == "dummy" else NullOutput()
+            clips = ClipCache(output, pcm_cache=pcm_cache)
+            session = PlaybackSession(output, clip_cache=clips)
+            session.set_audio(audio_file, open(audio_file, "rb"))
+            session.set_subtitles(srt_file, segments)
+            return session
+
+        print(f"{args.output} output, {args.seconds:g}s audio, {cues} segments")
+        for name in args.scripts:
+            think = PLAYBACK_SCRIPTS[name] if args.think is None else args.think
+            ops = navigation_script(name, cues, args.steps, args.seed)
+
+            session = open_session()
+            latency = run_playback_script(session, ops, think)
+            stats = session.stats
+            session.close()
+
+            tracemalloc.start()
+            session = open_session()
+            run_playback_script(session, ops, think)
+            clip_mb = session.clip_cache.cached_bytes / 1024**2
+            session.close()
+            peak = tracemalloc.get_traced_memory()[1] / 1024**2
+            tracemalloc.stop()
+
+            print(f"\n{name} ({len(ops)} operations, {think * 1000:g} ms apart)")
+            for op, histogram in latency.items():
+                print(f"  {op:9s} {histogram.summary()}")
+            print(
+                f"  clips: {stats['cached']} cached, {stats['built']} built, "
+                f"{stats['stream']} streamed"
+            )
+            print(f"  memory: clip cache {clip_mb:.1f} MB, peak traced {peak:.1f} MB")
+
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"\nPeak RSS: {rss:.1f} MB")
+    return 0
+
+
+def write_clips(directory, count, sampling_rate, seed=0):
+    """Write `count` WAV clips of 0.5-2.5 s, cut from one synthetic recording"""
+    rng = np.random.default_rng(seed)
+    source = synthetic_speech(60, sampling_rate, seed=seed)
+    clips = []
+    for i in range(count):
+        frames = int(rng.uniform(0.5, 2.5) * sampling_rate)
+        start = int(rng.integers(0, len(source) // 2 - frames)) * 2
+        path = os.path.join(directory, f"clip_{i:05d}.wav")
+        write_wav(path, source[start : start + frames * 2], sampling_rate, 1)
+        clips.append(path)
+    return clips
+
+
+def write_mp3_clips(directory, count, source, seed=0):
+    """Write `count` MP3 clips of 20-60 frames copied from the `source` MP3
+
+    The clips start mid-stream, so a decoder may skip a clip's first frame;
+    that does not matter for timing the join.
+    """
+    rng = np.random.default_rng(seed)
+    index = scan_mp3(source)
+    with open(source, "rb") as f:
+        data = f.read()
+    clips = []
+    for i in range(count):
+        frames = int(rng.integers(20, 61))
+        first = int(rng.integers(0, len(index) - frames))
+        end = index.offsets[first + frames] if first + frames < len(index) else None
+        path = os.path.join(directory, f"clip_{i:05d}.mp3")
+        with open(path, "wb") as f:
+            f.write(data[index.offsets[first] : end or index.data_end])
+        clips.append((path, frames))
+    return clips
+
+
+def bench_mp3_concat(args):
+    """Time joining MP3 clips by copying frames against decoding them
+
+    The decode path writes WAV, so it is timed without an encoder, but needs
+    ffmpeg to decode the clips.
+    """
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        clips = write_mp3_clips(tmp_dir, max(args.counts), args.mp3, args.seed)
+        index = scan_mp3(clips[0][0])
+        gap_frames = round(
+            args.gap * index.sample_rate / 1000 / index.samples_per_frame
+        )
+        output = os.path.join(tmp_dir, "joined.mp3")
+        for count in args.counts:
+            files = [path for path, _ in clips[:count]]
+            size = sum(os.path.getsize(path) for path in files) / 1024**2
+            print(f"\n{count} MP3 clips ({size:.1f} MB), {args.gap} ms gaps")
+            duration, elapsed, peak = measure(
+                concatenate_files, files, output, args.gap
+            )
+            print(
+                f"  frame copy: {duration / 1000:8.0f}s audio, {elapsed:.3f}s, "
+                f"{size / elapsed:.0f} MB/s, peak {peak:.1f} MB"
+            )
+            frames = sum(n for _, n in clips[:count]) + gap_frames * (count - 1)
+            if len(scan_mp3(output)) != frames:
+                failures += 1
+                print(f"  MISMATCH: joined file does not have {frames} frames")
+
+            wav_output = os.path.join(tmp_dir, "decoded.wav")
+            try:
+                start = time.perf_counter()
+                concatenate_files(files, wav_output, args.gap, frame_copy=False)
+            except OSError as e:
+                print(f"  decode:     skipped ({e})")
+                continue
+            print(f"  decode:     {time.perf_counter() - start:.3f}s")
+
+    print("\nFrame counts agree" if not failures else f"\n{failures} mismatches")
+    return 1 if failures else 0
+
+
+def pydub_concatenate(file_list, output_file, gap_ms=0):
+    """The previous `combined += audio` loop of tts.py, for reference
+
+    The silence is made at the clips' sample rate so the outputs can be
+    compared sample for sample; the original made it at pydub's default
+    11025 Hz, which resampling left a frame short now and then.
+    """
+    from pydub import AudioSegment
+
+    combined = AudioSegment.empty()
+    silence = None
+    for i, file in enumerate(file_list):
+        audio = AudioSegment.from_file(file)
+        if silence is None:
+            silence = AudioSegment.silent(duration=gap_ms, frame_rate=audio.frame_rate)
+        combined += audio
+        if i < len(file_list) - 1:
+            combined += silence
+    combined.export(output_file, format="wav")
+    return len(combined)
+
+
+def wav_frames(path):
+    with wave.open(path, "rb") as w:
+        return w.getparams()[:3], w.readframes(w.getnframes())
+
+
+def bench_concat(args):
+    """Time and measure the memory of joining many clips with silence gaps
+
+    WAV output, so the time is that of decoding and joining, not of an encoder.
+    The previous pydub loop is run at every count by default; it is quadratic
+    (about 20 minutes for 3000 clips), so --reference-limit can cap it, and
+    the counts it was not compared at are listed at the end.
+    With --mp3, MP3 clips are joined by copying frames instead.
+    """
+    if args.mp3:
+        return bench_mp3_concat(args)
+    failures = 0
+    skipped = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        clips = write_clips(tmp_dir, max(args.counts), args.sampling_rate, args.seed)
+        output = os.path.join(tmp_dir, "joined.wav")
+        reference = os.path.join(tmp_dir, "reference.wav")
+        for count in args.counts:
+            print(f"\n{count} clips, {args.gap} ms gaps")
+            duration, elapsed, peak = measure(
+                concatenate_files, clips[:count], output, args.gap
+            )
+            print(
+                f"  streaming: {duration / 1000:8.0f}s audio, {elapsed:.3f}s, "
+                f"peak {peak:.1f} MB"
+            )
+            if args.reference_limit is not None and count > args.reference_limit:
+                skipped.append(count)
+                print(
+                    f"  pydub:     NOT COMPARED (over --reference-limit "
+                    f"{args.reference_limit})"
+                )
+                continue
+
+            duration, elapsed, peak = measure_once(
+                pydub_concatenate, clips[:count], reference, args.gap
+            )
+            print(
+                f"  pydub:     {duration / 1000:8.0f}s audio, {elapsed:.3f}s, "
+                f"peak {peak:.1f} MB"
+            )
+            if wav_frames(output) != wav_frames(reference):
+                failures += 1
+                print("  MISMATCH: streaming and pydub outputs differ")
+
+    if skipped:
+        counts = ", ".join(str(count) for count in skipped)
+        print(f"\nNot compared with the pydub loop at {counts} clips")
+    print("\nOutputs agree" if not failures else f"\n{failures} mismatches")
+    return 1 if failures else 0
+
+
+def fake_tts_client(latency, error_rate, seed=0):
+    """A stand-in for edge_tts.Communicate and the counts it keeps
+
+    Each request waits about `latency` seconds, fails with probability
+    `error_rate`, and otherwise streams the text itself as the "audio".
+    """
+    rng = np.random.default_rng(seed)
+    stats = {"requests": 0, "failed": 0, "in_flight": 0, "peak": 0}
+
+    class FakeCommunicate:
+        def __init__(self, text, voice, rate=None, pitch=None):
+            self.text = text
+
+        async def stream(self):
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["peak"] = max(stats["peak"], stats["in_flight"])
+            try:
+                await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+                if rng.random() < error_rate:
+                    stats["failed"] += 1
+                    raise ConnectionError("fake service error")
+                yield {"type": "audio", "data": self.text.encode("utf-8")}
+            finally:
+                stats["in_flight"] -= 1
+
+    return FakeCommunicate, stats
+
+
+def bench_tts(args):
+    """Run the TTS generation against a fake service with errors
+
+    Checks that failed requests are retried, that every line ends up in its
+    own file and that the files come back in line order, and reports the
+    scheduler's latency and concurrency. Needs no network or edge_tts.
+    """
+    from tts import generate_all
+    from tts_scheduler import AdaptiveScheduler
+
+    client, stats = fake_tts_client(args.latency, args.error_rate, args.seed)
+    scheduler = AdaptiveScheduler(
+        args.concurrency, rate=args.rate, burst=args.concurrency, backoff=args.backoff
+    )
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jobs = [
+            (i + 1, f"Sentence number {i}", os.path.join(tmp_dir, f"{i}.mp3"))
+            for i in range(args.lines)
+        ]
+        start = time.perf_counter()
+        # Keep the per-line output out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            files = asyncio.run(
+                generate_all(jobs, scheduler, client=client, max_retries=args.retries)
+            )
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{args.lines} lines in {elapsed:.2f}s: {stats['requests']} requests, "
+            f"{stats['failed']} failed and retried, peak {stats['peak']} in flight"
+        )
+        print(f"  latency: {scheduler.latency.summary()}")
+        print(
+            f"  concurrency limit: {scheduler.limit_range[0]:.0f}-"
+            f"{scheduler.limit_range[1]:.0f}"
+        )
+        if files != [job[2] for job in jobs]:
+            failures += 1
+            print("  MISMATCH: files missing or out of line order")
+        for _, text, path in jobs:
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                if f.read() != text.encode("utf-8"):
+                    failures += 1
+                    print(f"  MISMATCH: {path} does not hold its line")
+        if args.error_rate and not stats["failed"]:
+            failures += 1
+            print("  MISMATCH: no request failed, retries were not exercised")
+        leftovers = [name for name in os.listdir(tmp_dir) if name.endswith(".part")]
+        if leftovers:
+            failures += 1
+            print(f"  MISMATCH: {len(leftovers)} partial files left behind")
+
+    print("\nAll lines in order" if not failures else f"\n{failures} mismatches")
+    return 1 if failures else 0
+
+
+# (audio file, subtitle files in its folder, expected match or None)
+CATALOG_CASES = [
+    ("Section 3.mp3", ["Section 3 2023 notes.srt", "Section 32023.srt"], 0),
+    ("Lesson 1.mp3", ["Lesson 1 (1).srt", "Lesson 11.srt"], 0),
+    ("Section 3.mp3", ["Unit 2 Section 3 notes.srt", "Section 13.srt"], 0),
+    ("Section 3.mp3", ["01 Section 3.srt", "Section 3b extra notes.srt"], 0),
+    ("lesson_01.mp3", ["Lesson 01.srt"], 0),
+    ("Lesson 3.mp3", ["Lesson 13.srt", "Lesson 4.srt"], None),
+    ("Section 1.mp3", ["Section 21.srt", "Section 2 part 1.srt"], None),
+    # The old rule (name contained in the file name) is still the last resort
+    ("Talk 2.mp3", ["Talk 20.srt", "Talk 2 (final).srt"], 1),
+    ("Talk 2.mp3", ["Talk 20.srt"], 0),
+]
+
+
+def bench_catalog(args):
+    """Check subtitle matching on tricky names and time lookups in a big folder
+
+    Each case is a folder with one audio file and a few subtitle files; the
+    expected subtitle must come first, or none may be found. Then a folder of
+    `--files` recordings, each with its own subtitle under a slightly
+    different name, is searched for every recording.
+    """
+    from file_catalog import FileCatalog
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, (audio_name, subtitles, expected) in enumerate(CATALOG_CASES):
+            directory = os.path.join(tmp_dir, str(i))
+            os.mkdir(directory)
+            for name in subtitles:
+                open(os.path.join(directory, name), "w").close()
+            found, _ = FileCatalog().find_subtitle(os.path.join(directory, audio_name))
+            found = found and os.path.basename(found)
+            wanted = None if expected is None else subtitles[expected]
+            status = "ok" if found == wanted else "MISMATCH"
+            failures += found != wanted
+            print(f"  {status}: {audio_name!r} -> {found!r} (expected {wanted!r})")
+
+        directory = os.path.join(tmp_dir, "library")
+        os.mkdir(directory)
+        audio_files = []
+        for i in range(args.files):
+            audio_files.append(os.path.join(directory, f"Lesson {i + 1:04d}.mp3"))
+            name = f"lesson_{i + 1:04d} (transcript).srt"
+            open(os.path.join(directory, name), "w").close()
+        catalog = FileCatalog()
+        start = time.perf_counter()
+        missing = sum(
+            catalog.find_subtitle(audio_file)[0] is None for audio_file in audio_files
+        )
+        elapsed = time.perf_counter() - start
+        print(
+            f"\n{args.files} lookups in a folder of {args.files} subtitles: "
+            f"{elapsed / args.files * 1000:.2f} ms each, {missing} not found"
+        )
+        failures += missing
+
+    print("\nAll subtitles matched" if not failures else f"\n{failures} mismatches")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the audio tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backends = subparsers.add_parser(
+        "backends", help="Compare segmentation backends for speed and identical output"
+    )
+    backends.add_argument("--seconds", type=float, default=600, help="Audio length")
+    backends.add_argument("--seed", type=int, default=0, help="Random seed")
+    backends.set_defaults(func=bench_backends)
+
+    pipeline = subparsers.add_parser(
+        "pipeline", help="Time decode, split and SRT writing on synthetic audio"
+    )
+    pipeline.add_argument(
+        "--lengths",
+        type=float,
+        nargs="+",
+        default=PIPELINE_LENGTHS,
+        help="Audio lengths in seconds",
+    )
+    pipeline.add_argument(
+        "--backends", nargs="+", default=sorted(SPLIT_BACKENDS), help="Backends"
+    )
+    pipeline.add_argument("--seed", type=int, default=0, help="Random seed")
+    pipeline.add_argument(
+        "--output", default="benchmark_results.json", help="JSON results file"
+    )
+    pipeline.set_defaults(func=bench_pipeline)
+
+    srt = subparsers.add_parser(
+        "srt", help="Time and measure memory of SRT parsing on large files"
+    )
+    srt.add_argument("--cues", type=int, default=100000, help="Cues per file")
+    srt.set_defaults(func=bench_srt)
+
+    playback = subparsers.add_parser(
+        "playback", help="Latency and memory of scripted navigation, headless"
+    )
+    playback.add_argument(
+        "--output",
+        choices=["dummy", "null"],
+        default="dummy",
+        help="SDL dummy audio driver or a null sink",
+    )
+    playback.add_argument(
+        "--scripts",
+        nargs="+",
+        choices=sorted(PLAYBACK_SCRIPTS),
+        default=list(PLAYBACK_SCRIPTS),
+        help="Navigation scripts to run",
+    )
+    playback.add_argument("--steps", type=int, default=60, help="Operations per script")
+    playback.add_argument(
+        "--think", type=float, help="Seconds between operations (default per script)"
+    )
+    playback.add_argument("--seconds", type=float, default=600, help="Audio length")
+    playback.add_argument("--seed", type=int, default=0, help="Random seed")
+    playback.set_defaults(func=bench_playback)
+
+    concat = subparsers.add_parser(
+        "concat", help="Time and measure memory of joining clips with silence gaps"
+    )
+    concat.add_argument(
+        "--counts", type=int, nargs="+", default=CONCAT_COUNTS, help="Clips to join"
+    )
+    concat.add_argument(
+        "--gap", type=int, default=4000, help="Silence between clips (ms)"
+    )
+    concat.add_argument(
+        "--sampling-rate", type=int, default=16000, help="Sample rate of the clips"
+    )
+    concat.add_argument(
+        "--reference-limit",
+        type=int,
+        help="Largest count to also run the quadratic pydub loop on (default: all)",
+    )
+    concat.add_argument(
+        "--mp3", help="Cut MP3 clips from this file and time the frame-copy join"
+    )
+    concat.add_argument("--seed", type=int, default=0, help="Random seed")
+    concat.set_defaults(func=bench_concat)
+
+    tts = subparsers.add_parser(
+        "tts", help="Check TTS retries and line order against a fake service"
+    )
+    tts.add_argument("--lines", type=int, default=500, help="Lines to synthesize")
+    tts.add_argument(
+        "--error-rate", type=float, default=0.1, help="Share of failing requests"
+    )
+    tts.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds per fake request"
+    )
+    tts.add_argument("--concurrency", type=int, default=8, help="Initial concurrency")
+    tts.add_argument("--rate", type=float, default=200, help="Requests per second")
+    tts.add_argument(
+        "--backoff", type=float, default=0.05, help="Pause after an error (seconds)"
+    )
+    tts.add_argument("--retries", type=int, default=10, help="Attempts per line")
+    tts.add_argument("--seed", type=int, default=0, help="Random seed")
+    tts.set_defaults(func=bench_tts)
+
+    catalog = subparsers.add_parser(
+        "catalog", help="Check and time finding the subtitle for a recording"
+    )
+    catalog.add_argument(
+        "--files", type=int, default=2000, help="Recordings in the large folder"
+    )
+    catalog.set_defaults(func=bench_catalog)
+
+    compare = subparsers.add_parser("compare", help="Compare two pipeline result files")
+    compare.add_argument("baseline", help="Results of the previous version")
+    compare.add_argument("current", help="Results of the new version")
+    compare.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Allowed slowdown or memory growth before flagging (0.1 = 10%%)",
+    )
+    compare.set_defaults(func=compare_results)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+import wave
+import threading
+from collections import OrderedDict
+
+# numpy 和 pcm_cache（经由 auditok 导入 matplotlib）在第一次准备片段时才导入，
+# 听写助手启动时不需要它们
+SAMPLE_WIDTH_TO_DTYPE = {1: "int8", 2: "int16", 4: "int32"}
+
+
+def make_clip(audio, start, end, mixer_format):
+    """把解码后音频的 start-end 秒转换为混音器格式的 16 位 PCM 字节
+
+    `audio` 为 CachedAudio，`mixer_format` 为 AudioOutput.mixer_format() 的结果。
+    声道数和采样率与混音器不同时做简单的声道混合与线性插值重采样。
+    """
+    import numpy as np
+
+    frequency, _, mixer_channels = mixer_format
+    sr, sw, ch = audio.sampling_rate, audio.sample_width, audio.channels
+    frame_bytes = sw * ch
+    first = max(0, round(start * sr)) * frame_bytes
+    last = max(first, round(end * sr) * frame_bytes)
+    samples = np.frombuffer(audio.data[first:last], dtype=SAMPLE_WIDTH_TO_DTYPE[sw])
+    samples = samples.reshape(-1, ch).astype(np.float32)
+    # 统一为 16 位幅度
+    samples *= 2.0 ** (16 - 8 * sw)
+
+    if ch != mixer_channels:
+        samples = np.repeat(samples.mean(axis=1, keepdims=True), mixer_channels, axis=1)
+
+    if sr != frequency and len(samples) > 1:
+        n_out = max(1, round(len(samples) * frequency / sr))
+        positions = np.linspace(0, len(samples) - 1, n_out)
+        indices = np.arange(len(samples))
+        samples = np.column_stack(
+            [
+                np.interp(positions, indices, samples[:, c])
+                for c in range(mixer_channels)
+            ]
+        )
+
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+def make_mp3_clip(audio_file, index, start, end, output):
+    """只解码覆盖 start-end 秒的 MP3 帧，返回混音器格式的 PCM 字节
+
+    `index` 为 MP3Index。帧数据由 `output`（AudioOutput）解码为混音器格式，
+    再按索引截取到与完整解码逐样本一致的片段。
+    """
+    frequency, _, mixer_channels = output.mixer_format()
+    data, _, last = index.read_frames(audio_file, start, end)
+    raw = output.decode(data)
+    frame_bytes = 2 * mixer_channels
+    first, last = index.trim(start, end, last, len(raw) // frame_bytes, frequency)
+    return raw[first * frame_bytes : last * frame_bytes]
+
+
+def read_wav_range(audio_file, start, end):
+    """直接定位读取 WAV 文件 start-end 秒的 PCM，返回从 0 秒开始的 CachedAudio"""
+    from pcm_cache import CachedAudio
+
+    with wave.open(audio_file, "rb") as w:
+        sr = w.getframerate()
+        w.setpos(min(w.getnframes(), round(start * sr)))
+        data = w.readframes(round(end * sr) - round(start * sr))
+        return CachedAudio(data, sr, w.getsampwidth(), w.getnchannels())
+
+
+class ClipCache:
+    """预取片段音频的内存缓存，按总字节数做 LRU 淘汰
+
+    音频由后台线程通过 PCMCache 解码一次（之后从磁盘映射读取），每个字幕片段切成
+    一个可播放的片段（由 `output`，即 AudioOutput 创建，如 pygame.mixer.Sound）；
+    MP3 文件有帧索引（MP3Index）时只解码片段所在的帧，WAV 文件直接定位读取
+    片段的数据，都不解码整个文件。每次播放后预取之后 `ahead` 个片段和前一个
+    片段，所以下一段、上一段和重播都能直接从内存开始播放。还没准备好的片段
+    get 返回 None，调用方可改用流式播放。
+
+    用法:
+        clips = ClipCache(PygameOutput())
+        clips.set_source("lesson.mp3", segments)
+        sound = clips.get(0)  # 未就绪时为 None
+        clips.prefetch(0)
+    """
+
+    def __init__(self, output, max_bytes=256 * 1024**2, ahead=3, pcm_cache=None):
+        self.output = output
+        self.max_bytes = max_bytes
+        self.ahead = ahead
+        self.pcm_cache = pcm_cache
+        self._clips = OrderedDict()  # 片段序号 -> (片段, 字节数)
+        self._bytes = 0
+        self._queue = []
+        self._source = None  # (音频文件, 片段表, MP3Index 或 None)
+        self._audio = None
+        self._generation = 0
+        self._failed = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def set_source(self, audio_file, segments, mp3_index=None):
+        """切换到新的音频和字幕，清空缓存并开始解码"""
+        with self._condition:
+            self._generation += 1
+            self._source = (audio_file, segments, mp3_index)
+            self._audio = None
+            self._failed = False
+            self._clips.clear()
+            self._bytes = 0
+            self._queue = list(range(min(len(segments), self.ahead + 1)))
+            self._condition.notify()
+
+    @property
+    def cached_bytes(self):
+        """已缓存片段的总字节数"""
+        with self._condition:
+            return self._bytes
+
+    def get(self, index):
+        """返回已缓存的片段，没有则返回 None"""
+        with self._condition:
+            entry = self._clips.get(index)
+            if entry is None:
+                return None
+            self._clips.move_to_end(index)
+            return entry[0]
+
+    def build(self, index):
+        """在当前线程立即准备一个片段并返回
+
+        只在能很快完成时准备：MP3 有帧索引（只解码几帧）、音频已解码，或 WAV 文件
+        （直接定位读取）。其他情况返回 None，由调用方退回流式播放。
+        """
+        with self._condition:
+            if self._source is None:
+                return None
+            generation = self._generation
+            audio_file, segments, mp3_index = self._source
+            audio = self._audio
+        start, end, _ = segments[index]
+        mixer_format = self.output.mixer_format()
+        try:
+            if mp3_index is not None:
+                clip = make_mp3_clip(audio_file, mp3_index, start, end, self.output)
+            elif audio is not None:
+                clip = make_clip(audio, start, end, mixer_format)
+            elif audio_file.lower().endswith(".wav"):
+                audio = read_wav_range(audio_file, start, end)
+                clip = make_clip(audio, 0, end - start, mixer_format)
+            else:
+                return None
+            sound = self.output.make_sound(clip)
+        except Exception as e:
+            print(f"Error preparing audio clip {index + 1}: {e}")
+            return None
+        self._store(generation, index, sound, len(clip))
+        return sound
+
+    def _store(self, generation, index, sound, size):
+        with self._condition:
+            # 用户已切换文件，丢弃旧文件的结果
+            if generation != self._generation:
+                return
+            self._clips[index] = (sound, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._clips) > 1:
+                _, (_, evicted) = self._clips.popitem(last=False)
+                self._bytes -= evicted
+
+    def prefetch(self, index):
+        """预取 index 附近的片段，替换尚未处理的预取请求"""
+        with self._condition:
+            if self._source is None or self._failed:
+                return
+            count = len(self._source[1])
+            wanted = [index] + list(range(index + 1, index + 1 + self.ahead))
+            wanted.append(index - 1)
+            self._queue = [i for i in wanted if 0 <= i < count and i not in self._clips]
+            self._condition.notify()
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                index = self._queue.pop(0)
+                generation = self._generation
+                audio_file, segments, mp3_index = self._source
+                audio = self._audio
+
+            start, end, _ = segments[index]
+            try:
+                clip = None
+                if mp3_index is not None:
+                    clip = make_mp3_clip(audio_file, mp3_index, start, end, self.output)
+                elif audio is None and audio_file.lower().endswith(".wav"):
+                    # 未压缩的 WAV 直接定位读取片段，不必把整个文件解码进缓存
+                    try:
+                        wav = read_wav_range(audio_file, start, end)
+                        clip = make_clip(
+                            wav, 0, end - start, self.output.mixer_format()
+                        )
+                    except wave.Error:
+                        # wave 不支持的编码（如浮点 WAV）仍由 PCMCache 解码
+                        pass
+                if clip is None:
+                    if audio is None:
+                        from pcm_cache import PCMCache
+
+                        cache = self.pcm_cache or PCMCache()
+                        audio = cache.load(audio_file)
+                        with self._condition:
+                            if generation == self._generation:
+                                self._audio = audio
+                    clip = make_clip(audio, start, end, self.output.mixer_format())
+                sound = self.output.make_sound(clip)
+            except Exception as e:
+                print(f"Error preparing audio clip {index + 1}: {e}")
+                with self._condition:
+                    if generation == self._generation:
+                        # 无法解码时不再重试，播放退回流式方式
+                        self._failed = True
+                        self._queue = []
+                continue
+
+            self._store(generation, index, sound, len(clip))
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
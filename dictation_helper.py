@@ -1,91 +1,235 @@
+import time
+
+# 从这里开始计时，--profile-startup 时打印导入和初始化各阶段的耗时
+STARTED = time.perf_counter()
+
 import os
 import sys
-import keyboard
-import json
-import time
-from PySide6.QtWidgets import (
-    QApplication,
-    QMainWindow,
-    QPushButton,
-    QLabel,
-    QVBoxLayout,
-    QHBoxLayout,
-    QWidget,
-    QFileDialog,
-    QProgressBar,
-    QMenu,
-)
-from PySide6.QtCore import Qt, QTimer, Signal, QObject
-from PySide6.QtGui import QAction
-import pygame
-import re
+import math
+import threading
+from instrumentation import StageTimer
+
+startup_timer = StageTimer()
+
+# keyboard 和 pygame 在窗口显示后（或第一次播放时）才导入
+with startup_timer.stage("import PySide6"):
+    from PySide6.QtWidgets import (
+        QApplication,
+        QMainWindow,
+        QPushButton,
+        QLabel,
+        QVBoxLayout,
+        QHBoxLayout,
+        QWidget,
+        QFileDialog,
+        QProgressBar,
+        QMenu,
+    )
+    from PySide6.QtCore import Qt, QTimer, Signal, QObject, QThreadPool
+    from PySide6.QtGui import QAction
+with startup_timer.stage("import modules"):
+    from file_loader import LoadSignals, LoadTask
+    from progress_store import ProgressStore
+    from playback_session import PlaybackSession, PygameOutput
 
 
 # 创建一个热键处理类，用于在线程间安全通信
 class KeyboardHandler(QObject):
+    """把 keyboard 线程中的热键事件转为 Qt 信号，并合并连续的导航
+
+    一段空闲后的第一次按键立即发出；之后 `min_interval` 秒内的下一段/上一段
+    按键累加成一次净跳转（例如连按五次 Enter 为 +5），在间隔结束时一起发出，
+    所以快速翻页只需一次定位和播放。间隔内的重播被并入导航，或合并为一次重播。
+    `stats` 记录收到、发出、被合并和抵消丢弃的事件数。
+    """
+
     # 信号可以传递一个来源标识字符串
-    replay_signal = Signal(str)
-    next_signal = Signal(str)
-    previous_signal = Signal(str)
+    # 最后一个参数为按键时间（time.perf_counter），用于测量延迟
+    replay_signal = Signal(str, float)
+    navigate_signal = Signal(int, str, float)  # 跳转的段数（正为向后），来源
     hotkey_pause_signal = Signal(str)
+    _schedule_signal = Signal(int)
 
-    def __init__(self):
+    def __init__(self, min_interval=0.15):
         super().__init__()
+        self.min_interval = min_interval
+        self.stats = {"received": 0, "emitted": 0, "merged": 0, "dropped": 0}
+        self._lock = threading.Lock()
+        self._pending_steps = 0
+        self._pending_replay = False
+        self._pending_events = 0
+        self._pending_since = 0.0  # 第一个被合并事件的时间
+        self._scheduled = False
+        self._last_emit = 0.0
+        # 计时器属于界面线程，由信号从 keyboard 线程启动
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._flush)
+        self._schedule_signal.connect(self._timer.start)
 
     def replay_triggered(self):
-        self.replay_signal.emit("hotkey")  # 使用字符串区分来源
+        self._add(0, replay=True)
 
     def next_triggered(self):
-        self.next_signal.emit("hotkey")
+        self._add(1)
 
     def previous_triggered(self):
-        self.previous_signal.emit("hotkey")
+        self._add(-1)
 
     def hotkey_pause_triggered(self):
         self.hotkey_pause_signal.emit("hotkey")
 
+    def _add(self, step, replay=False):
+        now = time.perf_counter()
+        with self._lock:
+            self.stats["received"] += 1
+            idle = now - self._last_emit >= self.min_interval
+            if idle and not self._scheduled:
+                # 空闲后的第一次按键不等待
+                self._last_emit = now
+                self.stats["emitted"] += 1
+                emit_now = True
+            else:
+                if not self._pending_events:
+                    self._pending_since = now
+                self._pending_steps += step
+                self._pending_replay = self._pending_replay or replay
+                self._pending_events += 1
+                emit_now = False
+                schedule = not self._scheduled
+                self._scheduled = True
+                delay = max(0.0, self._last_emit + self.min_interval - now)
+
+        if emit_now:
+            if replay:
+                self.replay_signal.emit("hotkey", now)  # 使用字符串区分来源
+            else:
+                self.navigate_signal.emit(step, "hotkey", now)
+        elif schedule:
+            self._schedule_signal.emit(int(delay * 1000))
+
+    def _flush(self):
+        with self._lock:
+            steps, replay = self._pending_steps, self._pending_replay
+            events, since = self._pending_events, self._pending_since
+            self._pending_steps, self._pending_replay = 0, False
+            self._pending_events = 0
+            self._scheduled = False
+            self._last_emit = time.perf_counter()
+            if steps or replay:
+                self.stats["emitted"] += 1
+                self.stats["merged"] += events - 1
+            else:
+                # 前进和后退相互抵消
+                self.stats["dropped"] += events
+
+        if steps:
+            self.navigate_signal.emit(steps, "hotkey", since)
+        elif replay:
+            self.replay_signal.emit("hotkey", since)
 
-class DictationHelper(QMainWindow):
-    def __init__(self):
-        super().__init__()
 
-        # 初始化音频播放器
-        pygame.mixer.init()
+class DictationHelper(QMainWindow):
+    """听写界面：显示 PlaybackSession 的状态，把按钮和热键转给它
 
-        # 设置程序状态变量
-        self.audio_file = None
-        self.srt_file = None
-        self.current_segment = -1  # 开始为-1，表示还没有播放任何片段
-        self.segments = []
-        self.playback_timer = QTimer(self)  # 用于控制播放时长
-        self.playback_timer.timeout.connect(self.stop_playback)
-        self.allow_hotkeys_flag = True
+    为了尽快显示窗口，构造时只建立界面；进度数据的读取和全局热键的注册在第一次
+    绘制之后进行（finish_startup），混音器在第一次使用时初始化。
+    """
 
-        # 状态保存相关
-        self.progress_data = {}
+    def __init__(self, profile_startup=False):
+        super().__init__()
+        self.profile_startup = profile_startup
+        self.started = False
+        self.first_paint = None  # 第一次绘制的时间（time.perf_counter）
 
         # 获取基础路径 - 区分打包环境和开发环境
         self.base_path = self.get_base_path()
         print(f"Base path: {self.base_path}")
         self.progress_file = os.path.join(self.base_path, "dictation_progress.json")
-        self.load_progress()
+        self.latency_file = os.path.join(self.base_path, "dictation_latency.jsonl")
+
+        # 导航、播放和进度都在会话中，窗口只负责显示
+        self.session = PlaybackSession(
+            PygameOutput(timer=startup_timer),
+            ProgressStore(self.progress_file),
+            listener=self,
+        )
+        # 单次计时器，在 session.next_tick() 给出的时间调用 session.tick()：
+        # 片段结束时停止流式播放，或在结束附近短暂轮询以记录延迟
+        self.tick_timer = QTimer(self)
+        self.tick_timer.setSingleShot(True)
+        self.tick_timer.setTimerType(Qt.PreciseTimer)
+        self.tick_timer.timeout.connect(self.on_tick)
+        self.allow_hotkeys_flag = True
+
+        # 后台加载：每次加载有编号，选择其他文件时取消旧的加载
+        self.thread_pool = QThreadPool.globalInstance()
+        self.load_signals = LoadSignals()
+        self.load_signals.finished.connect(self.on_load_finished)
+        self.load_signals.failed.connect(self.on_load_failed)
+        self.load_id = 0
+        self.load_cancel = None
+        self.loading = False
 
         # 设置UI
         self.init_ui()
 
-        # 创建热键处理器
+        # 创建热键处理器，全局热键在 finish_startup 中注册
         self.keyboard_handler = KeyboardHandler()
         self.keyboard_handler.replay_signal.connect(self.replay_current)
-        self.keyboard_handler.next_signal.connect(self.play_next)
-        self.keyboard_handler.previous_signal.connect(self.play_previous)
+        self.keyboard_handler.navigate_signal.connect(self.navigate)
         self.keyboard_handler.hotkey_pause_signal.connect(self.allow_hotkeys)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint is None:
+            # 窗口已经画出，在事件循环的下一轮完成其余的启动工作
+            self.first_paint = time.perf_counter()
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        """读取进度数据并注册全局热键；可重复调用，只执行一次"""
+        if self.started:
+            return
+        self.started = True
+
+        with startup_timer.stage("load progress"):
+            self.session.load_progress()
+
+        # 在后台初始化混音器，第一次打开文件时就不用在界面线程中等待
+        threading.Thread(target=self.session.output.prepare, daemon=True).start()
+
+        with startup_timer.stage("register hotkeys"):
+            try:
+                self.register_hotkeys()
+            except Exception as e:
+                # 例如 Linux 下没有权限读取键盘设备，按钮仍然可用
+                print(f"Could not register hotkeys: {e!r}")
+
+        if self.profile_startup:
+            self.print_startup_profile()
+
+    def register_hotkeys(self):
+        import keyboard
+
         # 设置全局热键 - 修改重播热键为alt+x
         keyboard.add_hotkey("alt+x", self.keyboard_handler.replay_triggered)
         keyboard.add_hotkey("enter", self.keyboard_handler.next_triggered)
         keyboard.add_hotkey("alt+left", self.keyboard_handler.previous_triggered)
         keyboard.add_hotkey("alt+n", self.keyboard_handler.hotkey_pause_triggered)
 
+    def print_startup_profile(self):
+        """打印启动各阶段的耗时；之后的阶段（如混音器初始化）在发生时打印"""
+        print("Startup profile:")
+        for line in startup_timer.summary():
+            print(f"  {line}")
+        if self.first_paint is not None:
+            print(f"  first paint after {self.first_paint - STARTED:.3f}s")
+        print(f"  ready after {time.perf_counter() - STARTED:.3f}s")
+        startup_timer.callbacks.append(
+            lambda name, wall, cpu: print(f"Startup profile: {name}: {wall:.3f}s")
+        )
+
     def get_base_path(self):
         if getattr(sys, "frozen", False):
             # 打包环境 - PyInstaller, cx_Freeze等
@@ -178,97 +322,20 @@ class DictationHelper(QMainWindow):
         central_widget.setLayout(main_layout)
         self.setCentralWidget(central_widget)
 
-    def load_progress(self):
-        """从JSON文件加载进度数据"""
-        try:
-            if os.path.exists(self.progress_file):
-                with open(self.progress_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.progress_data = data.get("progress", {})
-        except Exception as e:
-            print(f"Error loading progress data: {e}")
-            self.progress_data = {}
-
-    def save_progress(self):
-        """将当前进度保存到JSON文件"""
-        try:
-            data_to_save = {"progress": self.progress_data}
-
-            if self.audio_file:
-                file_key = self.get_file_key()
-                if file_key:
-                    current_segment = self.progress_data[file_key].get(
-                        "current_segment", -1
-                    )
-                    if current_segment < self.current_segment:
-                        current_segment = self.current_segment
-                    self.progress_data[file_key] = {
-                        "audio_file": self.audio_file,
-                        "srt_file": self.srt_file,
-                        "current_segment": current_segment,
-                        "last_accessed": int(time.time()),  # 添加最后访问时间
-                    }
-
-            # 保存数据
-            with open(self.progress_file, "w", encoding="utf-8") as f:
-                json.dump(data_to_save, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error saving progress data: {e}")
-
-    def get_file_key(self):
-        """根据音频文件名生成唯一键"""
-        if self.audio_file:
-            return os.path.basename(self.audio_file)
-        return None
-
-    def add_recent_file(self, file_path, file_type):
-        """添加文件到进度数据中"""
-        if not file_path or not os.path.exists(file_path):
-            return
-
-        # 更新当前文件的最后访问时间
-        file_key = (
-            os.path.basename(file_path) if file_type == "audio" else self.get_file_key()
-        )
-
-        if file_type == "audio":
-            # 如果是添加音频文件
-            self.progress_data[file_key] = self.progress_data.get(file_key, {})
-            self.progress_data[file_key]["audio_file"] = file_path
-            self.progress_data[file_key]["last_accessed"] = int(time.time())
-            if "current_segment" not in self.progress_data[file_key]:
-                self.progress_data[file_key]["current_segment"] = -1
-        elif file_type == "srt" and file_key:
-            # 如果是添加字幕文件，并且有对应的音频文件
-            if file_key in self.progress_data:
-                self.progress_data[file_key]["srt_file"] = file_path
-                self.progress_data[file_key]["last_accessed"] = int(time.time())
-
-        # 保存进度
-        self.save_progress()
-
-    def get_recent_files(self, file_type, limit=10):
-        """获取最近使用的文件列表"""
-        result = []
-        # 根据last_accessed排序进度数据
-        sorted_items = sorted(
-            self.progress_data.items(),
-            key=lambda x: x[1].get("last_accessed", 0),
-            reverse=True,
-        )
+    def segment_changed(self, index, total, text):
+        """会话回调：更新进度显示和字幕内容"""
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(index + 1)
+        self.progress_label.setText(f"{index + 1}/{total}")
+        self.content_label.setText(text)
 
-        # 获取文件路径
-        for _, data in sorted_items:
-            file_path = data.get(f"{file_type}_file")
-            if file_path and os.path.exists(file_path) and file_path not in result:
-                result.append(file_path)
-                if len(result) >= limit:
-                    break
-
-        return result
+    def status_changed(self, message):
+        """会话回调：显示状态信息"""
+        self.status_label.setText(message)
 
     def show_audio_menu(self):
         """显示音频文件选择菜单，包含最近文件"""
+        self.finish_startup()
         menu = QMenu(self)
 
         # 添加"浏览..."选项
@@ -277,7 +344,7 @@ class DictationHelper(QMainWindow):
         menu.addAction(browse_action)
 
         # 获取最近的音频文件
-        recent_audio_files = self.get_recent_files("audio")
+        recent_audio_files = self.session.get_recent_files("audio")
 
         # 如果有最近文件，添加分隔线和最近文件
         if recent_audio_files:
@@ -297,6 +364,7 @@ class DictationHelper(QMainWindow):
 
     def show_srt_menu(self):
         """显示字幕文件选择菜单，包含最近文件"""
+        self.finish_startup()
         menu = QMenu(self)
 
         # 添加"浏览..."选项
@@ -305,7 +373,7 @@ class DictationHelper(QMainWindow):
         menu.addAction(browse_action)
 
         # 获取最近的字幕文件
-        recent_srt_files = self.get_recent_files("srt")
+        recent_srt_files = self.session.get_recent_files("srt")
 
         # 如果有最近文件，添加分隔线和最近文件
         if recent_srt_files:
@@ -325,307 +393,185 @@ class DictationHelper(QMainWindow):
 
     def open_srt_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Select Subtitle File", "", "Subtitle Files (*.srt)"
+            self, "Select Subtitle File", "", "Subtitle Files (*.srt *.vtt *.json)"
         )
         if file_path:
-            # 重置播放状态
-            self.reset_playback_state()
-
-            self.srt_file = file_path
-            self.status_label.setText(
-                f"Subtitle file selected: {os.path.basename(file_path)}"
-            )
-            self.parse_srt()
-
-            # 如果音频文件已加载，尝试恢复进度
-            if self.audio_file:
-                self.restore_progress()
+            self.start_load(srt_file=file_path)
 
     def open_recent_audio(self, file_path):
         """打开最近使用的音频文件"""
-        # 重置播放状态
-        self.reset_playback_state()
-
-        self.audio_file = file_path
-        self.status_label.setText(f"Audio file selected: {os.path.basename(file_path)}")
-        pygame.mixer.music.load(self.audio_file)
-
-        # 添加到最近文件列表
-        self.add_recent_file(file_path, "audio")
-
-        # 自动寻找匹配的字幕文件
-        self.find_matching_subtitle()
+        self.start_load(audio_file=file_path)
 
-        # 尝试恢复之前的进度
-        self.restore_progress()
+    def start_load(self, audio_file=None, srt_file=None):
+        """在线程池中加载音频和/或字幕，完成后由 on_load_finished 更新界面"""
+        self.finish_startup()
+        # 取消仍在进行的加载
+        if self.load_cancel is not None:
+            self.load_cancel.set()
+        self.load_cancel = threading.Event()
+        self.load_id += 1
 
-    def find_matching_subtitle(self):
-        """自动寻找匹配的字幕文件"""
-        if not self.audio_file:
+        # 重置播放状态
+        self.tick_timer.stop()
+        self.session.reset()
+
+        saved_srt = self.session.saved_subtitle(audio_file) if audio_file else None
+        name = os.path.basename(audio_file or srt_file)
+        self.set_loading(True, f"Loading {name}...")
+        task = LoadTask(
+            self.load_id,
+            self.load_signals,
+            self.load_cancel,
+            audio_file=audio_file,
+            srt_file=srt_file,
+            saved_srt=saved_srt,
+            catalog=self.session.catalog,
+        )
+        self.thread_pool.start(task)
+
+    def set_loading(self, loading, message=None):
+        """加载中禁用播放按钮，并在状态栏显示提示"""
+        self.loading = loading
+        for button in (self.prev_btn, self.replay_btn, self.next_btn):
+            button.setEnabled(not loading)
+        if message:
+            self.status_label.setText(message)
+
+    def on_load_finished(self, load_id, result):
+        # 已被新的加载取代的结果直接丢弃
+        if load_id != self.load_id:
+            LoadTask.discard(result)
             return
+        self.set_loading(False)
 
-        # 先检查是否在进度数据中有记录
-        file_key = self.get_file_key()
-        print(file_key, self.audio_file, self.srt_file)
-        if file_key and file_key in self.progress_data:
-            saved_srt = self.progress_data[file_key].get("srt_file")
-            if saved_srt and os.path.exists(saved_srt):
-                self.srt_file = saved_srt
-                self.status_label.setText(
-                    f"Found saved subtitle: {os.path.basename(saved_srt)}"
-                )
-                print("Found saved subtitle:", saved_srt)
-                self.parse_srt()
-                return
-
-        # 如果进度数据中没有，则寻找同名的SRT文件
-        audio_dir = os.path.dirname(self.audio_file)
-        audio_name = os.path.splitext(os.path.basename(self.audio_file))[0]
-
-        # 尝试在相同目录下找同名.srt文件
-        potential_srt = os.path.join(audio_dir, audio_name + ".srt")
-        if os.path.exists(potential_srt):
-            self.srt_file = potential_srt
+        audio_file = result["audio_file"]
+        if audio_file:
+            # 同时加入最近文件列表
+            self.session.set_audio(
+                audio_file, result["audio_stream"], result["mp3_index"]
+            )
             self.status_label.setText(
-                f"Auto-loaded subtitle: {os.path.basename(potential_srt)}"
+                f"Audio file selected: {os.path.basename(audio_file)}"
             )
-            print("Auto-loaded subtitle:", potential_srt)
-            self.add_recent_file(potential_srt, "srt")
-            self.parse_srt()
-            return
 
-        # 尝试在相同目录下找包含音频文件名的.srt文件
-        for file in os.listdir(audio_dir):
-            if file.endswith(".srt") and audio_name.lower() in file.lower():
-                potential_srt = os.path.join(audio_dir, file)
-                self.srt_file = potential_srt
-                self.status_label.setText(f"Found similar subtitle: {file}")
+        srt_file = result["srt_file"]
+        if srt_file:
+            self.session.set_subtitles(srt_file, result["segments"])
+            found = result["found"]
+            if found == "saved":
+                print("Found saved subtitle:", srt_file)
+                status = f"Found saved subtitle: {os.path.basename(srt_file)}"
+            elif found == "auto":
+                print("Auto-loaded subtitle:", srt_file)
+                status = f"Auto-loaded subtitle: {os.path.basename(srt_file)}"
+            elif found == "similar":
+                print("Found similar subtitle:", srt_file)
+                status = f"Found similar subtitle: {os.path.basename(srt_file)}"
+            else:
+                status = f"Subtitle file selected: {os.path.basename(srt_file)}"
+            if found != "saved":
+                self.session.add_recent_file(srt_file, "srt")
+            if self.session.audio_file and not audio_file:
+                status = "Ready to start dictation, click 'Next' to begin"
+            self.status_label.setText(status)
+        elif audio_file:
+            self.status_label.setText(
+                "No matching subtitle found. Please select manually."
+            )
 
-                self.add_recent_file(potential_srt, "srt")
-                self.parse_srt()
-                print("Found saved subtitle:", potential_srt)
-                return
+        # 尝试恢复之前的进度
+        if self.session.audio_file:
+            self.restore_progress()
 
-        self.status_label.setText("No matching subtitle found. Please select manually.")
+    def on_load_failed(self, load_id, message):
+        if load_id != self.load_id:
+            return
+        self.set_loading(False, f"Error loading file: {message}")
 
     def restore_progress(self):
-        """恢复之前保存的进度"""
-        file_key = self.get_file_key()
-        if file_key and file_key in self.progress_data:
-            saved_data = self.progress_data[file_key]
-
-            # 检查SRT文件是否匹配或需要加载
-            if (
-                saved_data.get("srt_file")
-                and self.srt_file != saved_data["srt_file"]
-                and os.path.exists(saved_data["srt_file"])
-            ):
-                self.srt_file = saved_data["srt_file"]
-                self.parse_srt()
-
-            # 恢复到之前的段落位置
-            saved_segment = saved_data.get("current_segment", -1)
-            if 0 <= saved_segment < len(self.segments):
-                # 稍后播放，先更新UI
-                self.current_segment = (
-                    saved_segment - 1
-                )  # 设为前一个，这样play_next会播放正确的段落
-                self.status_label.setText(
-                    f"Progress restored - segment {saved_segment + 1}/{len(self.segments)}"
-                )
-                QTimer.singleShot(500, self.play_next)  # 延迟500ms后播放下一段
-
-            # 更新最后访问时间
-            saved_data["last_accessed"] = int(time.time())
-            self.save_progress()
+        """恢复之前保存的进度，稍后播放保存的片段"""
+        if self.session.restore_progress() is not None:
+            QTimer.singleShot(500, self.play_next)  # 延迟500ms后播放下一段
 
     def open_audio_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
             self, "Select Audio File", "", "Audio Files (*.mp3 *.wav *.ogg)"
         )
         if file_path:
-            # 重置播放状态
-            self.reset_playback_state()
-
-            self.audio_file = file_path
-            self.status_label.setText(
-                f"Audio file selected: {os.path.basename(file_path)}"
-            )
-            pygame.mixer.music.load(self.audio_file)  # 直接加载完整音频文件
-
-            # 添加到最近文件列表
-            self.add_recent_file(file_path, "audio")
-
-            # 自动寻找匹配的字幕文件
-            self.find_matching_subtitle()
-
-            # 尝试恢复之前的进度
-            self.restore_progress()
+            self.start_load(audio_file=file_path)
 
     def open_recent_srt(self, file_path):
         """打开最近使用的字幕文件"""
-        # 重置播放状态
-        self.reset_playback_state()
-
-        self.srt_file = file_path
-        self.status_label.setText(
-            f"Subtitle file selected: {os.path.basename(file_path)}"
-        )
-
-        # 添加到最近文件列表
-        self.add_recent_file(file_path, "srt")
-
-        self.parse_srt()
-
-        if self.audio_file:
-            self.status_label.setText("Ready to start dictation, click 'Next' to begin")
-            self.restore_progress()
-
-    def parse_srt(self):
-        if not self.srt_file:
-            return
-
-        try:
-            self.segments = []
-            with open(self.srt_file, "r", encoding="utf-8") as f:
-                content = f.read()
-
-            # 使用正则表达式匹配字幕条目
-            pattern = r"(\d+)\n(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})\n([\s\S]*?)(?=\n\n\d+\n|$)"
-            matches = re.findall(pattern, content)
-
-            for match in matches:
-                index = int(match[0])
-                start_time = self.time_to_seconds(match[1])
-                end_time = self.time_to_seconds(match[2])
-                text = match[3].strip()
-
-                self.segments.append(
-                    {"index": index, "start": start_time, "end": end_time, "text": text}
-                )
-
-            self.progress_bar.setMaximum(len(self.segments))
-            self.progress_label.setText(f"0/{len(self.segments)}")
+        self.start_load(srt_file=file_path)
 
-            if self.audio_file:
-                self.status_label.setText(
-                    "Ready to start dictation, click 'Next' to begin"
-                )
-
-        except Exception as e:
-            self.status_label.setText(f"Error parsing subtitle file: {e}")
-
-    def time_to_seconds(self, time_str):
-        # 将 "00:00:00,000" 格式的时间转换为秒
-        hours, minutes, seconds = time_str.replace(",", ".").split(":")
-        return float(hours) * 3600 + float(minutes) * 60 + float(seconds)
-
-    def play_audio_segment(self, segment_index):
-        if not self.audio_file or not self.segments:
-            return
-
-        if 0 <= segment_index < len(self.segments):
-            # 停止当前播放和计时器
-            pygame.mixer.music.stop()
-            self.playback_timer.stop()
-
-            segment = self.segments[segment_index]
-            start_time = segment["start"]
-            end_time = segment["end"]
-            duration = (end_time - start_time) * 1000  # 毫秒
+    def on_tick(self):
+        if self.session.tick():
+            self.schedule_tick()
 
-            # 设置播放位置并开始播放
-            pygame.mixer.music.play(0, start_time)
-
-            # 设置计时器在片段结束时停止播放
-            self.playback_timer.start(int(duration))
-
-            # 更新UI
-            self.current_segment = segment_index
-            self.progress_bar.setValue(segment_index + 1)
-            self.progress_label.setText(f"{segment_index + 1}/{len(self.segments)}")
-            self.content_label.setText(self.segments[segment_index]["text"])
+    def schedule_tick(self):
+        delay = self.session.next_tick()
+        if delay is None:
+            self.tick_timer.stop()
+        else:
+            # 向上取整，流式播放不会在片段结束前醒来
+            self.tick_timer.start(math.ceil(delay * 1000))
 
-            # 保存当前进度
-            self.save_progress()
+    def play_next(self, source=None, input_time=None):
+        self.navigate(1, source, input_time)
 
-    def stop_playback(self):
-        # 计时器触发时停止播放
-        pygame.mixer.music.stop()
-        self.playback_timer.stop()
+    def play_previous(self, source=None, input_time=None):
+        self.navigate(-1, source, input_time)
 
-    def play_next(self, source=None):
+    def navigate(self, steps, source=None, input_time=None):
+        """向后（steps > 0）或向前跳过若干段并播放，连续的热键只定位一次"""
         if source == "hotkey":
             if not self.allow_hotkeys_flag:
                 return
-        if not self.segments or not self.audio_file:
-            self.status_label.setText("Please select audio and subtitle files")
+        if source == "button" and input_time is None:
+            input_time = time.perf_counter()
+        if self.loading:
             return
 
-        next_segment = 0 if self.current_segment == -1 else self.current_segment + 1
+        if self.session.navigate(steps, input_time):
+            self.schedule_tick()
 
-        if next_segment < len(self.segments):
-            self.play_audio_segment(next_segment)
-        else:
-            self.status_label.setText("All segments have been played")
-
-    def play_previous(self, source=None):
+    def replay_current(self, source=None, input_time=None):
         if source == "hotkey":
             if not self.allow_hotkeys_flag:
                 return
-
-        if not self.segments or not self.audio_file:
-            self.status_label.setText("Please select audio and subtitle files")
+        if source == "button" and input_time is None:
+            input_time = time.perf_counter()
+        if self.loading:
             return
 
-        if self.current_segment > 0:
-            self.play_audio_segment(self.current_segment - 1)
-        else:
-            self.status_label.setText("This is the first segment")
-
-    def replay_current(self, source=None):
-        if source == "hotkey":
-            if not self.allow_hotkeys_flag:
-                return
-
-        if self.current_segment >= 0 and self.segments and self.audio_file:
-            self.play_audio_segment(self.current_segment)
-        else:
-            self.status_label.setText("No segment is currently playing")
+        if self.session.replay(input_time):
+            self.schedule_tick()
 
     def allow_hotkeys(self, allow):
         self.allow_hotkeys_flag = not self.allow_hotkeys_flag
         print("Hotkeys are now ", "enabled" if self.allow_hotkeys_flag else "disabled")
 
-    def reset_playback_state(self):
-        """重置播放状态"""
-        # 停止当前播放和计时器
-        pygame.mixer.music.stop()
-        self.playback_timer.stop()
-
-        # 重置状态变量
-        self.current_segment = -1
-        self.srt_file = None
-        self.segments = []
-
-        # 重置UI
-        self.progress_bar.setValue(0)
-        self.progress_label.setText(f"0/{len(self.segments)}")
-        self.content_label.setText("")
-
     def closeEvent(self, event):
-        # 保存当前进度
-        self.save_progress()
+        stats = self.keyboard_handler.stats
+        print(
+            f"Hotkeys: {stats['received']} events, {stats['emitted']} actions, "
+            f"{stats['merged']} merged, {stats['dropped']} dropped"
+        )
+
+        self.session.save_latency(self.latency_file)
 
-        # 停止播放和计时器
-        pygame.mixer.music.stop()
-        self.playback_timer.stop()
-        pygame.mixer.quit()
+        # 保存当前进度并写入尚未落盘的更新，停止播放
+        self.tick_timer.stop()
+        self.session.close()
         event.accept()
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = DictationHelper()
-    window.show()
+    profile_startup = "--profile-startup" in sys.argv
+    with startup_timer.stage("QApplication"):
+        app = QApplication(sys.argv)
+    with startup_timer.stage("create window"):
+        window = DictationHelper(profile_startup)
+    with startup_timer.stage("show window"):
+        window.show()
     sys.exit(app.exec())
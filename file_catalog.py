@@ -0,0 +1,228 @@
+import os
+import re
+import difflib
+import threading
+
+# 自动匹配的字幕扩展名，与旧版只找 .srt 相同
+SUBTITLE_EXTENSION = ".srt"
+
+
+def name_tokens(name):
+    """小写后的字母片段和数字片段，"Lesson 01_part2" 为 lesson、01、part、2"""
+    return re.findall(r"\d+|[^\W\d_]+", name.lower())
+
+
+def normalize_name(name):
+    """小写并去掉空格和标点，"Lesson 01" 与 "lesson_01" 视为相同"""
+    return "".join(name_tokens(name))
+
+
+def name_numbers(name):
+    """文件名中的数字，如 "Lesson 01 part 2" 为 (1, 2)
+
+    在去掉分隔符之前取数字，"Section 3 2023" 为 (3, 2023) 而不是 (32023,)。
+    """
+    return tuple(int(token) for token in name_tokens(name) if token.isdigit())
+
+
+def subtitle_entry(file_name):
+    """rank_names 的候选：(以空格连接的片段, 规范化主文件名, 数字, 文件名)"""
+    tokens = name_tokens(os.path.splitext(file_name)[0])
+    numbers = tuple(int(token) for token in tokens if token.isdigit())
+    return " ".join(tokens), "".join(tokens), numbers, file_name
+
+
+def contains_pattern(tokens):
+    """在以空格分隔的片段中寻找 `tokens` 的正则表达式
+
+    片段之间的分隔可有可无（"section3" 匹配 "section 3"），但两个数字之间
+    必须分开（"3 2" 不匹配 "32"）；两端是数字时，匹配处不能紧接着别的数字
+    （"section 1" 不匹配 "section 10"）。
+    """
+    pattern = re.escape(tokens[0])
+    for previous, token in zip(tokens, tokens[1:]):
+        digits = previous[-1].isdigit() and token[0].isdigit()
+        pattern += (" " if digits else " ?") + re.escape(token)
+    if tokens[0][0].isdigit():
+        pattern = "(?<!\\d)" + pattern
+    if tokens[-1][-1].isdigit():
+        pattern += "(?!\\d)"
+    return re.compile(pattern)
+
+
+def rank_names(name, candidates, cutoff=0.6):
+    """按与主文件名 `name` 的相似度排序候选，返回 [(分数, 文件名), ...]，最相近的在前
+
+    `candidates` 为 subtitle_entry 的结果。包含 `name` 全部片段的候选分数
+    大于 1，多出的字符越少越靠前，不论其中还有什么数字（"Section 3" 匹配
+    "01 Section 3"、"Section 3 2023 notes" 和 "Unit 2 Section 3 notes"），
+    只要 `name` 两端的数字没有接着别的数字（"Section 1" 不匹配
+    "Section 10"）。其他候选按 difflib 的相似度（0-1）排序，低于 `cutoff`
+    的舍弃；编号不同的录音不是同一个文件，所以这些候选的数字必须以 `name`
+    的数字开头（"Lesson 3" 不匹配 "Lesson 13"）。最后是旧版的规则：文件名
+    包含 `name`（不区分大小写）的候选排在最后，分数为 0，所以旧版能找到的
+    字幕现在也能找到。
+    """
+    tokens = name_tokens(name)
+    if not tokens:
+        return []
+    key = "".join(tokens)
+    numbers = name_numbers(name)
+    count = len(numbers)
+    contains = contains_pattern(tokens).search
+    lowered = name.lower()
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    # seq2 的统计信息会被缓存，所以固定的 key 放在 seq2
+    matcher.set_seq2(key)
+    scored = []
+    for spaced, candidate_key, candidate_numbers, file_name in candidates:
+        if contains(spaced):
+            score = 1 + len(key) / len(candidate_key)
+        else:
+            score = None
+            if candidate_numbers[:count] == numbers:
+                matcher.set_seq1(candidate_key)
+                if (
+                    matcher.real_quick_ratio() >= cutoff
+                    and matcher.quick_ratio() >= cutoff
+                ):
+                    score = matcher.ratio()
+                    if score < cutoff:
+                        score = None
+            if score is None:
+                if lowered not in file_name.lower():
+                    continue
+                score = 0
+        scored.append((score, file_name))
+    scored.sort(key=lambda item: -item[0])
+    return scored
+
+
+class DirectoryListing:
+    """一个目录的文件名，以及其中字幕文件的候选（subtitle_entry）"""
+
+    __slots__ = ("mtime", "names", "subtitles")
+
+    def __init__(self, mtime, names, subtitles):
+        self.mtime = mtime
+        self.names = names  # os.path.normcase 后的文件名集合
+        self.subtitles = subtitles  # [subtitle_entry(文件名), ...]
+
+
+class FileCatalog:
+    """按目录缓存的文件索引：寻找音频对应的字幕、检查最近文件是否还在
+
+    每个目录只用 os.scandir 读取一次，之后每次查询只 stat 目录本身，目录的
+    修改时间变化（有文件被添加、删除或改名）时重新读取。所以在有几千个录音的
+    文件夹中打开文件也不必每次列目录和逐个比较文件名。
+
+    最近文件菜单不应在打开时逐个访问磁盘（网络驱动器上可能很慢）：
+    check_in_background 在后台线程中检查路径，known_exists 只返回已知的结果。
+
+    用法:
+        catalog = FileCatalog()
+        srt_file, found = catalog.find_subtitle("lessons/lesson 01.mp3")
+        catalog.check_in_background(recent_paths)
+        visible = [p for p in recent_paths if catalog.known_exists(p)]
+    """
+
+    def __init__(self):
+        self._listings = {}
+        self._exists = {}  # 路径 -> 后台检查的结果
+        self._queue = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def listing(self, directory):
+        """目录的 DirectoryListing，目录不存在或无法读取时返回 None"""
+        directory = directory or "."
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        with self._condition:
+            listing = self._listings.get(directory)
+        if listing is not None and listing.mtime == mtime:
+            return listing
+
+        names = set()
+        subtitles = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    names.add(os.path.normcase(entry.name))
+                    stem, extension = os.path.splitext(entry.name)
+                    if extension.lower() == SUBTITLE_EXTENSION:
+                        subtitles.append(subtitle_entry(entry.name))
+        except OSError:
+            return None
+        listing = DirectoryListing(mtime, names, subtitles)
+        with self._condition:
+            self._listings[directory] = listing
+        return listing
+
+    def exists(self, path):
+        """path 是否存在（通过所在目录的缓存列表判断）"""
+        listing = self.listing(os.path.dirname(path))
+        return (
+            listing is not None
+            and os.path.normcase(os.path.basename(path)) in listing.names
+        )
+
+    def rank_subtitles(self, audio_file, limit=5):
+        """与音频同目录、文件名最相近的字幕文件，最相近的在前"""
+        audio_dir = os.path.dirname(audio_file)
+        listing = self.listing(audio_dir)
+        if listing is None:
+            return []
+        name = os.path.splitext(os.path.basename(audio_file))[0]
+        ranked = rank_names(name, listing.subtitles)
+        return [os.path.join(audio_dir, file) for _, file in ranked[:limit]]
+
+    def find_subtitle(self, audio_file, saved_srt=None):
+        """寻找与音频匹配的字幕文件，返回 (路径, 来源)，找不到时返回 (None, None)
+
+        来源为 "saved"（进度数据中记录的字幕）、"auto"（同名 .srt）或 "similar"
+        （同目录下文件名最相近的 .srt）。
+        """
+        if saved_srt and self.exists(saved_srt):
+            return saved_srt, "saved"
+
+        audio_dir = os.path.dirname(audio_file)
+        audio_name = os.path.splitext(os.path.basename(audio_file))[0]
+
+        # 尝试在相同目录下找同名.srt文件
+        potential_srt = os.path.join(audio_dir, audio_name + SUBTITLE_EXTENSION)
+        if self.exists(potential_srt):
+            return potential_srt, "auto"
+
+        # 尝试在相同目录下找文件名最相近的.srt文件
+        matches = self.rank_subtitles(audio_file, limit=1)
+        if matches:
+            return matches[0], "similar"
+
+        return None, None
+
+    def known_exists(self, path):
+        """后台检查得到的结果；还没检查过的路径视为存在"""
+        with self._condition:
+            return self._exists.get(path, True)
+
+    def check_in_background(self, paths):
+        """在后台线程中检查这些路径是否存在，结果由 known_exists 返回"""
+        with self._condition:
+            self._queue.extend(paths)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                path = self._queue.pop(0)
+            exists = self.exists(path)
+            with self._condition:
+                self._exists[path] = exists
@@ -0,0 +1,87 @@
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from subtitle_writer import load_cues
+from mp3_index import load_index
+from file_catalog import FileCatalog
+
+
+class LoadSignals(QObject):
+    # 参数为加载编号和结果 / 错误信息，在界面线程中接收
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+
+
+class LoadTask(QRunnable):
+    """在 QThreadPool 中读取音频、寻找并解析字幕
+
+    音频文件只在后台打开，不读入内存：流式播放时混音器从打开的文件边读边放，
+    片段由 ClipCache 直接从文件读取，所以几个小时的 WAV 也不占用同样大的内存，
+    而慢速或网络存储上的打开和索引都不在界面线程进行。`cancel` 是
+    threading.Event，选择其他文件时置位，任务在下一步之前放弃（关闭已打开的
+    文件），不再发出信号。结果为字典：
+    {"audio_file", "audio_stream", "mp3_index", "srt_file", "found", "segments"}，
+    其中 audio_stream 为打开的二进制文件，由接收方负责关闭。MP3 文件同时读取
+    （或首次建立）帧索引，用于精确定位片段。没有指定字幕时由
+    `catalog`（FileCatalog）寻找匹配的字幕文件。
+    """
+
+    def __init__(
+        self,
+        load_id,
+        signals,
+        cancel,
+        audio_file=None,
+        srt_file=None,
+        saved_srt=None,
+        catalog=None,
+    ):
+        super().__init__()
+        self.load_id = load_id
+        self.signals = signals
+        self.cancel = cancel
+        self.audio_file = audio_file
+        self.srt_file = srt_file
+        self.saved_srt = saved_srt
+        self.catalog = catalog or FileCatalog()
+
+    def run(self):
+        result = {
+            "audio_file": self.audio_file,
+            "audio_stream": None,
+            "mp3_index": None,
+            "srt_file": self.srt_file,
+            "found": None,
+            "segments": None,
+        }
+        try:
+            if self.audio_file:
+                result["audio_stream"] = open(self.audio_file, "rb")
+                if self.cancel.is_set():
+                    return self.discard(result)
+                if self.audio_file.lower().endswith(".mp3"):
+                    try:
+                        result["mp3_index"] = load_index(self.audio_file)
+                    except (OSError, ValueError) as e:
+                        print(f"Could not index MP3 frames: {e}")
+                if not self.srt_file:
+                    result["srt_file"], result["found"] = self.catalog.find_subtitle(
+                        self.audio_file, self.saved_srt
+                    )
+            if self.cancel.is_set():
+                return self.discard(result)
+
+            if result["srt_file"]:
+                result["segments"] = load_cues(result["srt_file"])
+            if self.cancel.is_set():
+                return self.discard(result)
+            self.signals.finished.emit(self.load_id, result)
+        except Exception as e:
+            self.discard(result)
+            if not self.cancel.is_set():
+                self.signals.failed.emit(self.load_id, str(e))
+
+    @staticmethod
+    def discard(result):
+        """关闭没有交给接收方的音频文件"""
+        if result["audio_stream"] is not None:
+            result["audio_stream"].close()
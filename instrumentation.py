@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import cProfile
+import contextlib
+import subprocess
+
+
+class StageTimer:
+    """Record wall and CPU time per named stage of a run
+
+    Stages can be nested; the time spent in an inner stage is not counted in
+    the outer one, so the stages of a run add up to its total. Every finished
+    stage is passed to each `callbacks` entry as `callback(name, wall, cpu)`.
+
+    Usage:
+        timer = StageTimer()
+        with timer.stage("decode"):
+            audio = load(audio_file)
+        for region in timer.timed_iter(regions, "segmentation"):
+            ...
+        print(timer.stages)  # {"decode": {"wall": ..., "cpu": ...}, ...}
+    """
+
+    def __init__(self, callbacks=()):
+        self.stages = {}
+        self.callbacks = list(callbacks)
+        self._active = []  # [wall, cpu] already used by inner stages
+
+    def add(self, name, wall, cpu):
+        stage = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+        stage["wall"] += wall
+        stage["cpu"] += cpu
+        for callback in self.callbacks:
+            callback(name, wall, cpu)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        inner = [0.0, 0.0]
+        self._active.append(inner)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._active.pop()
+            if self._active:
+                self._active[-1][0] += wall
+                self._active[-1][1] += cpu
+            self.add(name, wall - inner[0], cpu - inner[1])
+
+    def timed_iter(self, iterable, name):
+        """Yield from `iterable`, counting the time spent producing items as `name`"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def total(self):
+        wall = sum(stage["wall"] for stage in self.stages.values())
+        cpu = sum(stage["cpu"] for stage in self.stages.values())
+        return wall, cpu
+
+    def summary(self):
+        """One line per stage, with the CPU share telling CPU- from I/O-bound"""
+        lines = []
+        for name, stage in self.stages.items():
+            share = stage["cpu"] / stage["wall"] if stage["wall"] > 0 else 0
+            lines.append(
+                f"{name}: {stage['wall']:.3f}s wall, {stage['cpu']:.3f}s CPU ({share:.0%})"
+            )
+        return lines
+
+
+class Histogram:
+    """Distribution of durations, in fixed millisecond buckets plus percentiles
+
+    Values are in seconds and may be negative (for example a segment that
+    ended early); buckets count their absolute value.
+
+    Usage:
+        latency = Histogram()
+        latency.add(0.012)
+        print(latency.summary())
+        record = latency.to_dict()
+    """
+
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+    def __init__(self):
+        self.values = []
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+
+    def add(self, seconds):
+        self.values.append(seconds)
+        ms = abs(seconds) * 1000
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def percentile(self, fraction):
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        if not self.values:
+            return "no samples"
+        p50, p90, p99 = (self.percentile(f) * 1000 for f in (0.5, 0.9, 0.99))
+        worst = max(self.values, key=abs) * 1000
+        return (
+            f"n={len(self.values)}, p50 {p50:.1f} ms, p90 {p90:.1f} ms, "
+            f"p99 {p99:.1f} ms, worst {worst:.1f} ms"
+        )
+
+    def to_dict(self):
+        labels = [f"<={bound}ms" for bound in self.BUCKETS_MS] + [
+            f">{self.BUCKETS_MS[-1]}ms"
+        ]
+        record = {"count": len(self.values), "buckets": dict(zip(labels, self.counts))}
+        if self.values:
+            record.update(
+                p50=self.percentile(0.5),
+                p90=self.percentile(0.9),
+                p99=self.percentile(0.99),
+                mean=sum(self.values) / len(self.values),
+            )
+        return record
+
+
+def git_version():
+    """`git describe` of the source tree, or None outside a git checkout"""
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def append_metrics(metrics_file, record):
+    """Append one record to a JSON lines metrics file"""
+    with open(metrics_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@contextlib.contextmanager
+def profiled(profile_file):
+    """Run the block under cProfile and dump the stats to `profile_file`
+
+    Does nothing when `profile_file` is None. The dump can be read with
+    `python -m pstats` or snakeviz.
+    """
+    if profile_file is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(os.path.abspath(profile_file)), exist_ok=True)
+        profiler.dump_stats(profile_file)
@@ -0,0 +1,277 @@
+import os
+import json
+import mmap
+import hashlib
+import tempfile
+from array import array
+
+DEFAULT_INDEX_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "AudioDictationKit", "mp3index"
+)
+
+# Bitrates in kbps by (MPEG-1?, layer)
+BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sampling rates by version bits (0: MPEG-2.5, 2: MPEG-2, 3: MPEG-1)
+SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+# Samples the decoder outputs before the first real sample (MDCT overlap),
+# skipped by decoders together with the encoder delay of a LAME tag
+DECODER_DELAY = 529
+
+# Frames decoded before the requested range, so the bit reservoir (up to 511
+# bytes of earlier frames) and the MDCT overlap are complete: 4 frames give
+# bit-identical samples to decoding the whole file
+PREROLL_FRAMES = 4
+
+
+def parse_header(b0, b1, b2, b3):
+    """Decode an MPEG audio frame header
+
+    Returns (frame_length, sample_rate, samples_per_frame, channels), or None if
+    the four bytes are not a valid header.
+    """
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    channels = 1 if b3 >> 6 == 3 else 2
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, sample_rate, 384, channels
+    if layer == 3 and not mpeg1:
+        return 72 * bitrate // sample_rate + padding, sample_rate, 576, channels
+    return 144 * bitrate // sample_rate + padding, sample_rate, 1152, channels
+
+
+def _id3_size(data):
+    """Length of an ID3v2 tag at the start of `data`, or 0"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _vbr_tag(data, offset, mpeg1, channels):
+    """Look for a Xing/Info/VBRI header in the frame at `offset`
+
+    Returns (is_tag_frame, encoder_delay); the delay is None without a LAME tag.
+    """
+    side_info = (32 if channels == 2 else 17) if mpeg1 else (17 if channels == 2 else 9)
+    xing = offset + 4 + side_info
+    if data[xing : xing + 4] in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[xing + 4 : xing + 8], "big")
+        lame = xing + 8
+        lame += 4 if flags & 1 else 0  # frame count
+        lame += 4 if flags & 2 else 0  # byte count
+        lame += 100 if flags & 4 else 0  # seek table
+        lame += 4 if flags & 8 else 0  # quality
+        if data[lame : lame + 4] == b"LAME" or data[lame : lame + 4] == b"Lavc":
+            delay = data[lame + 21 : lame + 24]
+            if len(delay) == 3:
+                return True, (delay[0] << 4) | (delay[1] >> 4)
+        return True, None
+    if data[offset + 36 : offset + 40] == b"VBRI":
+        return True, None
+    return False, None
+
+
+class MP3Index:
+    """Byte offset of every audio frame of an MP3 file
+
+    Frame i holds decoded samples i * samples_per_frame onwards, so finding
+    the frame of a time is one division instead of a scan or a bitrate guess.
+    Times follow the decoded timeline, which starts after the encoder delay
+    when the file has a LAME tag (as ffmpeg and SDL_mixer decode it).
+
+    Usage:
+        index = load_index("lecture.mp3")
+        data, first, last = index.read_frames("lecture.mp3", 61.5, 64.0)
+        # decode `data`, then keep samples index.trim(61.5, 64.0, last, n, rate)
+    """
+
+    def __init__(
+        self, offsets, data_end, sample_rate, samples_per_frame, channels, delay=None
+    ):
+        self.offsets = offsets
+        self.data_end = data_end
+        self.sample_rate = sample_rate
+        self.samples_per_frame = samples_per_frame
+        self.channels = channels
+        self.delay = delay
+        self.skip = delay + DECODER_DELAY if delay is not None else 0
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def duration(self):
+        return self.frame_time(len(self.offsets))
+
+    def frame_time(self, frame):
+        """Time (seconds) of the first decoded sample of `frame`"""
+        return (frame * self.samples_per_frame - self.skip) / self.sample_rate
+
+    def frame_at(self, seconds):
+        """Index of the frame holding the sample at `seconds`"""
+        sample = int(seconds * self.sample_rate) + self.skip
+        frame = sample // self.samples_per_frame
+        return max(0, min(len(self.offsets) - 1, frame))
+
+    def byte_range(self, start, end, preroll=PREROLL_FRAMES):
+        """(first_frame, last_frame, first_byte, end_byte) covering start-end seconds"""
+        first = max(0, self.frame_at(start) - preroll)
+        last = self.frame_at(end)
+        end_byte = (
+            self.offsets[last + 1] if last + 1 < len(self.offsets) else self.data_end
+        )
+        return first, last, self.offsets[first], end_byte
+
+    def read_frames(self, audio_file, start, end, preroll=PREROLL_FRAMES):
+        """Read the frames covering start-end seconds as a stand-alone MP3 stream
+
+        Returns (data, first_frame, last_frame).
+        """
+        first, last, first_byte, end_byte = self.byte_range(start, end, preroll)
+        with open(audio_file, "rb") as f:
+            f.seek(first_byte)
+            return f.read(end_byte - first_byte), first, last
+
+    def trim(self, start, end, last_frame, decoded_samples, rate):
+        """Sample range of start-end seconds in decoded read_frames output
+
+        Counted back from the end of the chunk, which is exact even when the
+        decoder drops leading frames it cannot decode without earlier data.
+        `rate` is the sampling rate of the decoded samples.
+        """
+        chunk_end = self.frame_time(last_frame + 1)
+        first = decoded_samples - round((chunk_end - start) * rate)
+        last = decoded_samples - round((chunk_end - end) * rate)
+        return max(0, first), max(0, min(decoded_samples, last))
+
+    def to_bytes(self):
+        header = {
+            "data_end": self.data_end,
+            "sample_rate": self.sample_rate,
+            "samples_per_frame": self.samples_per_frame,
+            "channels": self.channels,
+            "delay": self.delay,
+        }
+        return json.dumps(header).encode("utf-8") + b"\n" + self.offsets.tobytes()
+
+    @classmethod
+    def from_bytes(cls, raw):
+        header_line, _, offsets_bytes = raw.partition(b"\n")
+        header = json.loads(header_line)
+        offsets = array("Q")
+        offsets.frombytes(offsets_bytes)
+        return cls(offsets, **header)
+
+
+def scan_mp3(audio_file):
+    """Build the MP3Index of a file by walking its frame headers"""
+    with open(audio_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty file: {audio_file}")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _scan(data)
+    finally:
+        data.close()
+
+
+def _scan(data):
+    size = len(data)
+    offsets = array("Q")
+    pos = _id3_size(data)
+    fmt = None
+    delay = None
+    data_end = pos
+
+    while pos + 4 <= size:
+        header = parse_header(data[pos], data[pos + 1], data[pos + 2], data[pos + 3])
+        if header is None or header[0] < 4 or (fmt and header[1:] != fmt):
+            # Lost sync (ID3v1/APE tag, garbage): look for the next frame
+            # header followed by another one
+            pos = data.find(b"\xff", pos + 1)
+            while pos != -1 and pos + 4 <= size:
+                header = parse_header(*data[pos : pos + 4])
+                if header and header[0] >= 4 and (not fmt or header[1:] == fmt):
+                    after = pos + header[0]
+                    if after + 4 > size or parse_header(*data[after : after + 4]):
+                        break
+                pos = data.find(b"\xff", pos + 1)
+            else:
+                break
+            continue
+
+        length = header[0]
+        if pos + length > size:
+            break
+        if fmt is None:
+            fmt = header[1:]
+            mpeg1 = data[pos + 1] & 0x18 == 0x18
+            is_tag, delay = _vbr_tag(data, pos, mpeg1, fmt[2])
+            if is_tag:
+                # The Xing/Info frame holds no audio
+                pos += length
+                continue
+        offsets.append(pos)
+        pos += length
+        data_end = pos
+
+    if fmt is None:
+        raise ValueError("No MPEG audio frames found")
+    sample_rate, samples_per_frame, channels = fmt
+    return MP3Index(offsets, data_end, sample_rate, samples_per_frame, channels, delay)
+
+
+def load_index(audio_file, cache_dir=DEFAULT_INDEX_DIR):
+    """Return the MP3Index of `audio_file`, from the sidecar cache when valid
+
+    The index is stored once per file path and rebuilt when the file's size or
+    modification time change.
+    """
+    path = os.path.abspath(audio_file)
+    stat = os.stat(path)
+    key = hashlib.sha1(path.encode("utf-8")).hexdigest()
+    index_file = os.path.join(cache_dir, f"{key}.idx")
+    stamp = f"{stat.st_size} {stat.st_mtime_ns}\n".encode("ascii")
+
+    try:
+        with open(index_file, "rb") as f:
+            raw = f.read()
+        if raw.startswith(stamp):
+            return MP3Index.from_bytes(raw[len(stamp) :])
+    except (OSError, ValueError):
+        pass
+
+    index = scan_mp3(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first so readers never see a partial index
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(stamp + index.to_bytes())
+    os.replace(tmp_path, index_file)
+    return index
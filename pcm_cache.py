@@ -0,0 +1,235 @@
+import os
+import json
+import mmap
+import time
+import hashlib
+import tempfile
+import contextlib
+from collections import namedtuple
+from auditok import load
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "AudioDictationKit", "pcm"
+)
+DEFAULT_MAX_BYTES = 4 * 1024**3  # 4 GiB
+
+# Decoded audio: `data` is a read-only memory map of the raw PCM
+CachedAudio = namedtuple(
+    "CachedAudio", ["data", "sampling_rate", "sample_width", "channels"]
+)
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PCMCache:
+    """Content-addressed on-disk cache of decoded PCM
+
+    Entries are keyed by the hash of the audio file and the decode parameters,
+    stored as raw PCM files and memory-mapped on load, so a file is decoded
+    once however many times it is segmented. The least recently used entries
+    are removed when the .pcm files on disk grow over `max_bytes`.
+
+    Several processes can share one cache (as the batch mode's workers do):
+    index.json is only read and rewritten while holding the lock file, and
+    decoding happens outside the lock.
+
+    Usage:
+        cache = PCMCache()
+        audio = cache.load("lecture.mp3")
+        samples = audio.data  # memory map, no decoding on later runs
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.lock_file = os.path.join(cache_dir, "index.lock")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the cache's lock file, so concurrent index updates are not lost"""
+        with open(self.lock_file, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass  # still held after LK_LOCK's retries
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_index(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = {}
+        index.setdefault("entries", {})
+        index.setdefault("files", {})
+        return index
+
+    def _write_index(self, index):
+        # Write to a temporary file first so readers never see a partial index
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_file)
+
+    @staticmethod
+    def _known_hash(index, path, stat):
+        """Recorded hash of the file content, or None if its size or mtime changed"""
+        known = index["files"].get(path)
+        if (
+            known
+            and known["size"] == stat.st_size
+            and known["mtime"] == stat.st_mtime_ns
+        ):
+            return known["sha256"]
+        return None
+
+    @staticmethod
+    def _make_key(content_hash, decode_params):
+        params = json.dumps(decode_params, sort_keys=True)
+        return hashlib.sha256(f"{content_hash}:{params}".encode("utf-8")).hexdigest()
+
+    def load(self, audio_file, **decode_params):
+        """Return the decoded audio of `audio_file` as CachedAudio
+
+        `decode_params` are passed to auditok.load on a cache miss (for example
+        `sr`, `sw` and `ch` for raw files) and are part of the cache key.
+        """
+        path = os.path.abspath(audio_file)
+        stat = os.stat(path)
+        with self._locked():
+            digest = self._known_hash(self._read_index(), path, stat)
+        if digest is None:
+            # Hashing a large file takes a while, so it is done outside the lock
+            digest = file_hash(path)
+        key = self._make_key(digest, decode_params)
+        pcm_file = os.path.join(self.cache_dir, f"{key}.pcm")
+
+        with self._locked():
+            index = self._read_index()
+            entry = index["entries"].get(key)
+            if entry is not None and os.path.exists(pcm_file):
+                return self._use(index, path, stat, digest, key, entry)
+
+        audio = load(audio_file, **decode_params)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio.data)
+        os.replace(tmp_path, pcm_file)
+        entry = {
+            "source": path,
+            "sampling_rate": audio.sampling_rate,
+            "sample_width": audio.sample_width,
+            "channels": audio.channels,
+            "size": len(audio.data),
+        }
+        print(f"Cached decoded audio: {audio_file}")
+
+        with self._locked():
+            # Re-read: other processes may have changed the index meanwhile
+            index = self._read_index()
+            index["entries"][key] = entry
+            return self._use(index, path, stat, digest, key, entry)
+
+    def _use(self, index, path, stat, digest, key, entry):
+        """Mark `key` as used, evict, save the index and map the entry
+
+        Called with the lock held.
+        """
+        index["files"][path] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "sha256": digest,
+        }
+        entry["last_used"] = time.time()
+        self._evict(index, keep=key)
+        self._write_index(index)
+        return CachedAudio(
+            self._map(os.path.join(self.cache_dir, f"{key}.pcm")),
+            entry["sampling_rate"],
+            entry["sample_width"],
+            entry["channels"],
+        )
+
+    @staticmethod
+    def _map(pcm_file):
+        with open(pcm_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _evict(self, index, keep=None):
+        """Remove least recently used entries until the cache fits in max_bytes
+
+        The size is that of the .pcm files on disk, so files missing from the
+        index (left by a crash) are counted and removed too, oldest first by
+        modification time. Index entries without a file are dropped.
+        """
+        on_disk = {}
+        with os.scandir(self.cache_dir) as files:
+            for file in files:
+                if file.name.endswith(".pcm"):
+                    stat = file.stat()
+                    on_disk[file.name[:-4]] = (stat.st_size, stat.st_mtime)
+        entries = index["entries"]
+        for key in [key for key in entries if key not in on_disk]:
+            del entries[key]
+
+        def last_used(key):
+            entry = entries.get(key)
+            return entry.get("last_used", 0) if entry else on_disk[key][1]
+
+        total = sum(size for size, _ in on_disk.values())
+        for key in sorted(on_disk, key=last_used):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, f"{key}.pcm"))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Still mapped by another process (Windows), try again next time
+                print(f"Could not evict cached audio {key}: {e}")
+                continue
+            total -= on_disk[key][0]
+            entries.pop(key, None)
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._locked():
+            for file in os.listdir(self.cache_dir):
+                if file.endswith(".pcm"):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, file))
+                    except OSError:
+                        pass
+            self._write_index({})
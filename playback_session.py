@@ -0,0 +1,561 @@
+import io
+import os
+import time
+import threading
+import contextlib
+
+from subtitle_writer import load_cues
+from clip_cache import ClipCache
+from file_catalog import FileCatalog
+from instrumentation import Histogram, append_metrics, git_version
+
+# 混音器缓冲区（采样数），声音在交给混音器后约延迟这么久才能听到
+MIXER_BUFFER = 512
+# 片段播放时不必计时：只在名义结束前 END_POLL 秒开始，每 END_POLL_INTERVAL
+# 秒检查一次混音器是否已停止，最多检查到名义结束后 END_POLL_LIMIT 秒
+END_POLL = 0.02
+END_POLL_INTERVAL = 0.002
+END_POLL_LIMIT = 0.25
+
+
+class AudioOutput:
+    """播放会话使用的音频输出接口
+
+    会话只通过这些方法发声，所以同一套导航逻辑可以接 pygame 混音器、SDL 的
+    dummy 驱动或不发声的 NullOutput。`make_sound` 返回的对象需要有
+    get_length()（秒）。
+    """
+
+    buffer = 0  # 输出缓冲区（采样数）
+
+    def prepare(self):
+        """提前完成费时的初始化（可在后台线程中调用）"""
+
+    def mixer_format(self):
+        """(采样率, 采样位数, 声道数)，与 pygame.mixer.get_init() 相同"""
+        raise NotImplementedError
+
+    def latency(self):
+        """交给输出后到开始发声的估计延迟（秒）"""
+        return self.buffer / self.mixer_format()[0]
+
+    def make_sound(self, pcm):
+        """用混音器格式的 16 位 PCM 字节创建可播放的片段"""
+        raise NotImplementedError
+
+    def decode(self, data):
+        """把压缩音频（如几个 MP3 帧）解码为混音器格式的 PCM 字节"""
+        raise NotImplementedError
+
+    def load_stream(self, stream, extension):
+        """载入音频文件（打开的二进制文件），用于流式播放；由输出负责关闭"""
+        raise NotImplementedError
+
+    def play_sound(self, sound):
+        raise NotImplementedError
+
+    def play_stream(self, start):
+        """从 start 秒开始流式播放已载入的音频"""
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def busy(self):
+        """play_sound 播放的片段是否还在发声"""
+        raise NotImplementedError
+
+    def close(self):
+        self.stop()
+
+
+class PygameOutput(AudioOutput):
+    """pygame 混音器输出；设置 SDL_AUDIODRIVER=dummy 可在没有声卡时运行
+
+    pygame 在第一次使用时才导入，混音器也在那时初始化（可能在预取线程中），
+    所以创建输出不会拖慢程序启动。给出 `timer`（StageTimer）时初始化时间记为
+    "mixer init" 阶段。
+    """
+
+    def __init__(self, buffer=MIXER_BUFFER, timer=None):
+        self.buffer = buffer
+        self.timer = timer
+        self._pygame = None
+        self._lock = threading.Lock()
+        self._stream = None  # 打开的音频文件，pygame.mixer.music 播放时一直读取
+        self._channel = None
+
+    def _mixer(self):
+        with self._lock:
+            if self._pygame is None:
+                if self.timer is not None:
+                    stage = self.timer.stage("mixer init")
+                else:
+                    stage = contextlib.nullcontext()
+                with stage:
+                    import pygame
+
+                    pygame.mixer.init(buffer=self.buffer)
+                self._pygame = pygame
+        return self._pygame.mixer
+
+    def prepare(self):
+        self._mixer()
+
+    def mixer_format(self):
+        return self._mixer().get_init()
+
+    def make_sound(self, pcm):
+        return self._mixer().Sound(buffer=pcm)
+
+    def decode(self, data):
+        # pygame 解码时会转换为混音器格式
+        return self._mixer().Sound(file=io.BytesIO(data)).get_raw()
+
+    def load_stream(self, stream, extension):
+        previous, self._stream = self._stream, stream
+        # 载入新文件时 pygame 已不再读取之前的文件
+        self._mixer().music.load(stream, extension)
+        if previous is not None:
+            previous.close()
+
+    def play_sound(self, sound):
+        self._channel = sound.play()
+
+    def play_stream(self, start):
+        self._mixer().music.play(0, start)
+
+    def stop(self):
+        # 还没初始化的混音器没有需要停止的声音
+        if self._pygame is not None:
+            self._pygame.mixer.music.stop()
+            self._pygame.mixer.stop()
+
+    def busy(self):
+        return self._channel is not None and self._channel.get_busy()
+
+    def close(self):
+        if self._pygame is not None:
+            self.stop()
+            self._pygame.mixer.quit()
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+class NullSound:
+    def __init__(self, pcm, bytes_per_second):
+        self.pcm = pcm
+        self.length = len(pcm) / bytes_per_second
+
+    def get_length(self):
+        return self.length
+
+
+class NullOutput(AudioOutput):
+    """丢弃音频的输出，按片段长度模拟播放时间，用于基准测试
+
+    不能解码压缩音频，所以 MP3 片段会退回流式播放（只计时，不发声）。
+    """
+
+    def __init__(self, frequency=44100, channels=2, buffer=0):
+        self.frequency = frequency
+        self.channels = channels
+        self.buffer = buffer
+        self._busy_until = 0.0
+
+    def mixer_format(self):
+        return self.frequency, -16, self.channels
+
+    def make_sound(self, pcm):
+        return NullSound(pcm, 2 * self.channels * self.frequency)
+
+    def decode(self, data):
+        raise NotImplementedError("NullOutput cannot decode compressed audio")
+
+    def load_stream(self, stream, extension):
+        stream.close()
+
+    def play_sound(self, sound):
+        self._busy_until = time.perf_counter() + sound.get_length()
+
+    def play_stream(self, start):
+        self._busy_until = float("inf")
+
+    def stop(self):
+        self._busy_until = 0.0
+
+    def busy(self):
+        return time.perf_counter() < self._busy_until
+
+
+class SessionListener:
+    """会话状态变化的回调，界面实现这些方法；默认什么也不做"""
+
+    def segment_changed(self, index, total, text):
+        """当前片段变化；index 为 -1 表示还没有播放任何片段"""
+
+    def status_changed(self, message):
+        pass
+
+
+class PlaybackSession:
+    """听写会话：字幕片段、当前位置、片段播放、延迟统计和进度记录
+
+    不依赖界面，所有声音经由 AudioOutput，显示经由 SessionListener。播放后在
+    next_tick() 给出的时间调用 tick()（界面用单次计时器），直到它返回 False：
+    流式播放在片段结束时由 tick 停止；片段播放时只在名义结束附近短暂轮询，
+    记录结束误差。
+
+    用法:
+        session = PlaybackSession(PygameOutput(), ProgressStore(progress_file))
+        session.load_progress()
+        session.set_audio("lesson.mp3", open("lesson.mp3", "rb"))
+        session.set_subtitles("lesson.srt", load_cues("lesson.srt"))
+        session.navigate(1, input_time=time.perf_counter())
+        while session.tick():
+            time.sleep(session.next_tick())
+    """
+
+    def __init__(
+        self, output, progress_store=None, listener=None, clip_cache=None, catalog=None
+    ):
+        self.output = output
+        self.progress_store = progress_store
+        self.listener = listener or SessionListener()
+        # 目录索引：寻找字幕，在后台检查最近文件是否还在
+        self.catalog = catalog or FileCatalog()
+        # 片段音频在后台解码并预取，播放时直接从内存开始
+        self.clip_cache = clip_cache or ClipCache(output)
+
+        self.audio_file = None
+        self.mp3_index = None  # MP3 帧索引，用于精确定位片段开头
+        self.srt_file = None
+        self.segments = []
+        self.current_segment = -1  # 开始为-1，表示还没有播放任何片段
+        self.progress_data = {}
+
+        # 精确模式：交给混音器的音频正好是片段的采样数，不需要计时器结束播放
+        self.exact_playback = True
+        # 延迟测量：按键/按钮到开始发声，片段名义结束到实际停止
+        self.latency = {"start": Histogram(), "end": Histogram()}
+        # 每次播放的来源：已缓存、当场准备或流式
+        self.stats = {"cached": 0, "built": 0, "stream": 0}
+        self.nominal_end = None  # 片段应当停止发声的时间（time.perf_counter）
+        self.stop_at = None  # 流式播放应停止的时间，片段播放时为 None
+
+    # 文件
+
+    def set_audio(self, audio_file, audio_stream, mp3_index=None):
+        """使用已打开的音频文件（二进制文件，交给输出），并加入最近文件"""
+        self.audio_file = audio_file
+        self.mp3_index = mp3_index
+        extension = os.path.splitext(audio_file)[1].lstrip(".").lower()
+        self.output.load_stream(audio_stream, extension)
+        self.add_recent_file(audio_file, "audio")
+
+    def set_subtitles(self, srt_file, segments):
+        """使用解析好的字幕片段，开始预取音频"""
+        self.srt_file = srt_file
+        self.segments = segments
+        if self.audio_file:
+            self.clip_cache.set_source(self.audio_file, self.segments, self.mp3_index)
+        self.listener.segment_changed(-1, len(self.segments), "")
+
+    def load_subtitles(self, srt_file):
+        """在当前线程解析字幕文件（支持 SRT、VTT 和 JSON），成功时返回 True"""
+        try:
+            # 逐行流式解析，字幕存为紧凑的数组表
+            self.set_subtitles(srt_file, load_cues(srt_file))
+        except Exception as e:
+            self.listener.status_changed(f"Error parsing subtitle file: {e}")
+            return False
+        if self.audio_file:
+            self.listener.status_changed(
+                "Ready to start dictation, click 'Next' to begin"
+            )
+        return True
+
+    def reset(self):
+        """停止播放，清空字幕和当前位置"""
+        self.stop()
+        self.current_segment = -1
+        self.srt_file = None
+        self.segments = []
+        self.listener.segment_changed(-1, 0, "")
+
+    # 播放
+
+    def play(self, segment_index, input_time=None):
+        """播放一个片段；input_time 为触发它的按键或点击时间，用于测量延迟"""
+        if not self.audio_file or not 0 <= segment_index < len(self.segments):
+            return False
+
+        # 停止当前播放
+        self.output.stop()
+        self.nominal_end = self.stop_at = None
+
+        start_time, end_time, text = self.segments[segment_index]
+        duration = end_time - start_time
+
+        sound = None
+        if self.exact_playback:
+            sound = self.clip_cache.get(segment_index)
+            if sound is not None:
+                self.stats["cached"] += 1
+            else:
+                # MP3 有帧索引时只需解码片段所在的几帧，WAV 可直接定位读取
+                sound = self.clip_cache.build(segment_index)
+                if sound is not None:
+                    self.stats["built"] += 1
+        if sound is not None:
+            # 片段已在内存中，长度正好是片段的采样数，播放完自然停止
+            self.output.play_sound(sound)
+            duration = sound.get_length()
+        else:
+            # 还没预取到，退回流式播放：设置播放位置，由 tick 在片段结束时停止
+            self.output.play_stream(start_time)
+            self.stop_at = time.perf_counter() + duration
+            self.stats["stream"] += 1
+
+        # 交给输出的时间，加上缓冲区延迟即开始发声的时间
+        audible = time.perf_counter() + self.output.latency()
+        if input_time is not None:
+            self.latency["start"].add(audible - input_time)
+        self.nominal_end = audible + duration
+
+        # 预取后面几个和前一个片段
+        self.clip_cache.prefetch(segment_index)
+
+        self.current_segment = segment_index
+        self.listener.segment_changed(segment_index, len(self.segments), text)
+
+        # 保存当前进度
+        self.save_progress()
+        return True
+
+    def tick(self):
+        """在片段结束时停止流式播放并记录结束误差；还需要继续调用时返回 True"""
+        if self.nominal_end is None:
+            return False
+        now = time.perf_counter()
+        if self.stop_at is not None:
+            if now < self.stop_at:
+                return True
+            self.output.stop()
+        elif now < self.nominal_end - END_POLL:
+            return True
+        elif self.output.busy() and now < self.nominal_end + END_POLL_LIMIT:
+            return True
+        stopped = now + self.output.latency()
+        self.latency["end"].add(stopped - self.nominal_end)
+        self.nominal_end = self.stop_at = None
+        return False
+
+    def next_tick(self):
+        """距离下次需要调用 tick() 的秒数，不再需要时为 None"""
+        if self.nominal_end is None:
+            return None
+        now = time.perf_counter()
+        if self.stop_at is not None:
+            return max(0.0, self.stop_at - now)
+        return max(END_POLL_INTERVAL, self.nominal_end - END_POLL - now)
+
+    def stop(self):
+        self.output.stop()
+        self.nominal_end = self.stop_at = None
+
+    def navigate(self, steps, input_time=None):
+        """向后（steps > 0）或向前跳过若干段并播放"""
+        if not self.segments or not self.audio_file:
+            self.listener.status_changed("Please select audio and subtitle files")
+            return False
+
+        if steps > 0:
+            if self.current_segment + 1 >= len(self.segments):
+                self.listener.status_changed("All segments have been played")
+                return False
+            target = min(self.current_segment + steps, len(self.segments) - 1)
+        else:
+            if self.current_segment <= 0:
+                self.listener.status_changed("This is the first segment")
+                return False
+            target = max(self.current_segment + steps, 0)
+
+        return self.play(target, input_time)
+
+    def replay(self, input_time=None):
+        if self.current_segment >= 0 and self.segments and self.audio_file:
+            return self.play(self.current_segment, input_time)
+        self.listener.status_changed("No segment is currently playing")
+        return False
+
+    # 进度
+
+    def get_file_key(self):
+        """根据音频文件名生成唯一键"""
+        if self.audio_file:
+            return os.path.basename(self.audio_file)
+        return None
+
+    def _record(self, file_key):
+        if self.progress_store is not None:
+            self.progress_store.update(file_key, self.progress_data[file_key])
+
+    def load_progress(self):
+        """从进度文件和日志加载进度数据"""
+        if self.progress_store is not None:
+            self.progress_data = self.progress_store.load()
+        # 最近文件菜单只使用后台检查的结果，不在打开菜单时访问磁盘
+        self.catalog.check_in_background(
+            data[f"{file_type}_file"]
+            for data in self.progress_data.values()
+            for file_type in ("audio", "srt")
+            if data.get(f"{file_type}_file")
+        )
+
+    def save_progress(self):
+        """记录当前文件的进度，由后台线程延迟写入，不阻塞播放"""
+        if not self.audio_file:
+            return
+        file_key = self.get_file_key()
+        current_segment = self.progress_data.get(file_key, {}).get(
+            "current_segment", -1
+        )
+        if current_segment < self.current_segment:
+            current_segment = self.current_segment
+        self.progress_data[file_key] = {
+            "audio_file": self.audio_file,
+            "srt_file": self.srt_file,
+            "current_segment": current_segment,
+            "last_accessed": int(time.time()),  # 添加最后访问时间
+        }
+        self._record(file_key)
+
+    def saved_subtitle(self, audio_file):
+        """进度数据中为音频记录的字幕文件"""
+        return self.progress_data.get(os.path.basename(audio_file), {}).get("srt_file")
+
+    def add_recent_file(self, file_path, file_type):
+        """添加文件到进度数据中"""
+        if not file_path or not os.path.exists(file_path):
+            return
+
+        # 更新当前文件的最后访问时间
+        file_key = (
+            os.path.basename(file_path) if file_type == "audio" else self.get_file_key()
+        )
+
+        if file_type == "audio":
+            # 如果是添加音频文件
+            self.progress_data[file_key] = self.progress_data.get(file_key, {})
+            self.progress_data[file_key]["audio_file"] = file_path
+            self.progress_data[file_key]["last_accessed"] = int(time.time())
+            if "current_segment" not in self.progress_data[file_key]:
+                self.progress_data[file_key]["current_segment"] = -1
+        elif file_type == "srt" and file_key:
+            # 如果是添加字幕文件，并且有对应的音频文件
+            if file_key in self.progress_data:
+                self.progress_data[file_key]["srt_file"] = file_path
+                self.progress_data[file_key]["last_accessed"] = int(time.time())
+
+        # 保存进度
+        if file_key in self.progress_data:
+            self._record(file_key)
+
+    def get_recent_files(self, file_type, limit=10):
+        """获取最近使用的文件列表
+
+        文件是否存在使用目录索引在后台检查的结果，同时重新检查返回的文件，
+        下次打开菜单时已被删除或移动的文件就不再出现。
+        """
+        result = []
+        # 根据last_accessed排序进度数据
+        sorted_items = sorted(
+            self.progress_data.items(),
+            key=lambda x: x[1].get("last_accessed", 0),
+            reverse=True,
+        )
+
+        # 获取文件路径
+        for _, data in sorted_items:
+            file_path = data.get(f"{file_type}_file")
+            if (
+                file_path
+                and file_path not in result
+                and self.catalog.known_exists(file_path)
+            ):
+                result.append(file_path)
+                if len(result) >= limit:
+                    break
+
+        self.catalog.check_in_background(result)
+        return result
+
+    def restore_progress(self):
+        """恢复之前保存的进度
+
+        需要时改用进度中记录的字幕，并把当前位置设为保存片段的前一个。返回要
+        继续播放的片段序号（之后 navigate(1) 会播放它），没有可恢复的进度时返回
+        None。
+        """
+        file_key = self.get_file_key()
+        if not file_key or file_key not in self.progress_data:
+            return None
+        saved_data = self.progress_data[file_key]
+
+        # 检查SRT文件是否匹配或需要加载
+        if (
+            saved_data.get("srt_file")
+            and self.srt_file != saved_data["srt_file"]
+            and self.catalog.exists(saved_data["srt_file"])
+        ):
+            self.load_subtitles(saved_data["srt_file"])
+
+        # 恢复到之前的段落位置
+        resume = None
+        saved_segment = saved_data.get("current_segment", -1)
+        if 0 <= saved_segment < len(self.segments):
+            # 设为前一个，这样 navigate(1) 会播放正确的段落
+            self.current_segment = saved_segment - 1
+            self.listener.status_changed(
+                f"Progress restored - segment {saved_segment + 1}/{len(self.segments)}"
+            )
+            resume = saved_segment
+
+        # 更新最后访问时间
+        saved_data["last_accessed"] = int(time.time())
+        self.save_progress()
+        return resume
+
+    # 统计与关闭
+
+    def save_latency(self, latency_file):
+        """打印延迟分布，并追加一行 JSON 到 latency_file，便于跨版本比较"""
+        if not self.latency["start"].values and not self.latency["end"].values:
+            return
+        print(f"Latency - hotkey to sound: {self.latency['start'].summary()}")
+        print(f"Latency - segment end error: {self.latency['end'].summary()}")
+        try:
+            append_metrics(
+                latency_file,
+                {
+                    "time": int(time.time()),
+                    "version": git_version(),
+                    "mode": "exact" if self.exact_playback else "stream",
+                    "mixer_buffer": self.output.buffer,
+                    "start": self.latency["start"].to_dict(),
+                    "end": self.latency["end"].to_dict(),
+                },
+            )
+        except OSError as e:
+            print(f"Error saving latency data: {e}")
+
+    def close(self):
+        """保存进度并写入尚未落盘的更新，停止播放和后台线程"""
+        self.save_progress()
+        if self.progress_store is not None:
+            self.progress_store.close()
+        self.stop()
+        self.clip_cache.close()
+        self.output.close()
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+
+class ProgressStore:
+    """听写进度存储：防抖的后台写入 + 追加式日志
+
+    进度文件本身（{"progress": {...}}，与旧版 dictation_progress.json 格式相同）
+    作为快照，每次更新只向旁边的 .journal 文件追加一行 JSON。写入由后台线程
+    在 `delay` 秒内合并后完成，调用 update 的界面线程从不等待磁盘。日志超过
+    `compact_every` 行时把全部数据写成新快照（临时文件 + 原子重命名）并清空日志。
+
+    旧版的进度文件无需转换，直接作为第一份快照读取，第一次压缩时改写为紧凑格式。
+
+    用法:
+        store = ProgressStore("dictation_progress.json")
+        progress = store.load()
+        store.update("lesson1.mp3", {"current_segment": 12})
+        store.close()  # 退出前写入剩余更新并压缩
+    """
+
+    def __init__(self, path, delay=1.0, compact_every=500):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.delay = delay
+        self.compact_every = compact_every
+        self._data = {}
+        self._pending = {}
+        self._journal_lines = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def load(self):
+        """读取快照并重放日志，返回 {文件键: 进度} 的副本"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._data = json.load(f).get("progress", {})
+        except FileNotFoundError:
+            self._data = {}
+        except Exception as e:
+            print(f"Error loading progress data: {e}")
+            self._data = {}
+
+        self._journal_lines = 0
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 写到一半就退出的最后一行
+                        continue
+                    self._apply(self._data, record["key"], record["value"])
+                    self._journal_lines += 1
+        except FileNotFoundError:
+            pass
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer, daemon=True)
+            self._thread.start()
+        return {key: dict(value) for key, value in self._data.items()}
+
+    @staticmethod
+    def _apply(data, key, value):
+        if value is None:
+            data.pop(key, None)
+        else:
+            data[key] = value
+
+    def update(self, key, value):
+        """记录一个文件的进度（value 为 None 表示删除），立即返回"""
+        with self._condition:
+            self._pending[key] = None if value is None else dict(value)
+            self._condition.notify()
+
+    def _writer(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                # 防抖：等一会儿，把连续的多次更新合并成一次写入
+                deadline = time.monotonic() + self.delay
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                pending, self._pending = self._pending, {}
+                closed = self._closed
+            if pending:
+                try:
+                    self._append(pending)
+                    if self._journal_lines >= self.compact_every:
+                        self.compact()
+                except Exception as e:
+                    print(f"Error saving progress data: {e}")
+            if closed:
+                return
+
+    def _append(self, pending):
+        lines = []
+        for key, value in pending.items():
+            self._apply(self._data, key, value)
+            lines.append(json.dumps({"key": key, "value": value}, ensure_ascii=False))
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self._journal_lines += len(lines)
+
+    def compact(self):
+        """把当前数据写成新快照并清空日志"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"progress": self._data}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        # 快照已包含日志中的全部更新，即使在这里中断，重放旧日志也得到相同结果
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+        self._journal_lines = 0
+
+    def close(self):
+        """写入剩余的更新，压缩日志并停止后台线程"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            if self._journal_lines:
+                self.compact()
+        except Exception as e:
+            print(f"Error saving progress data: {e}")
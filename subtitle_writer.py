@@ -0,0 +1,287 @@
+import os
+import json
+from array import array
+
+# File extension of each supported format
+FORMAT_EXTENSIONS = {"srt": ".srt", "vtt": ".vtt", "json": ".json"}
+
+
+def to_milliseconds(seconds):
+    """Convert seconds to whole milliseconds (truncated, as in SRT timestamps)"""
+    return int(round(seconds * 1_000_000)) // 1000
+
+
+def format_ms(ms, separator=","):
+    """Format milliseconds as HH:MM:SS,mmm (or HH:MM:SS.mmm with separator=".")"""
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{ms:03d}"
+
+
+def format_params(params):
+    """Format detection parameters as the NOTE line written before the first WebVTT cue"""
+    values = " ".join(f"{name}={value:g}" for name, value in sorted(params.items()))
+    return f"NOTE audio_to_srt {values}"
+
+
+def parse_params(line):
+    """Read detection parameters back from a NOTE line, or None if it is not one"""
+    if not line or not line.startswith("NOTE audio_to_srt "):
+        return None
+    params = {}
+    for item in line.split()[2:]:
+        name, _, value = item.partition("=")
+        params[name] = float(value)
+    return params
+
+
+def params_file(srt_file):
+    """Sidecar file with the detection parameters of an SRT file"""
+    return f"{srt_file}.params.json"
+
+
+def write_params(srt_file, params):
+    """Record detection parameters next to `srt_file` (or remove stale ones)"""
+    path = params_file(srt_file)
+    if not params:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(params, f, sort_keys=True)
+
+
+def read_params(srt_file):
+    """Detection parameters recorded for `srt_file`, or None
+
+    Older files recorded them in a NOTE line before the first cue, which is
+    still read when there is no sidecar file.
+    """
+    try:
+        with open(params_file(srt_file), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        return None
+    try:
+        with open(srt_file, "r", encoding="utf-8-sig") as f:
+            return parse_params(f.readline().strip())
+    except OSError:
+        return None
+
+
+def parse_timestamp(timestamp):
+    """Convert an SRT/VTT timestamp (HH:MM:SS,mmm or MM:SS.mmm) to milliseconds"""
+    timestamp = timestamp.strip()
+    if len(timestamp) == 12 and timestamp[2] == ":" and timestamp[5] == ":":
+        # Fast path for the usual HH:MM:SS,mmm
+        return (
+            int(timestamp[0:2]) * 3_600_000
+            + int(timestamp[3:5]) * 60_000
+            + int(timestamp[6:8]) * 1000
+            + int(timestamp[9:12])
+        )
+    clock, _, ms = timestamp.replace(".", ",").partition(",")
+    seconds = 0
+    for part in clock.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds * 1000 + int(ms.ljust(3, "0")[:3] or 0)
+
+
+class SRTFormat:
+    # SRT has no comments; parameters go to a sidecar file (write_params)
+    def header(self, params):
+        return ""
+
+    def cue(self, index, start_ms, end_ms, text):
+        return f"{index}\n{format_ms(start_ms)} --> {format_ms(end_ms)}\n{text}\n\n"
+
+    def footer(self):
+        return ""
+
+
+class VTTFormat:
+    def header(self, params):
+        header = "WEBVTT\n\n"
+        if params:
+            header += f"{format_params(params)}\n\n"
+        return header
+
+    def cue(self, index, start_ms, end_ms, text):
+        start, end = format_ms(start_ms, "."), format_ms(end_ms, ".")
+        return f"{index}\n{start} --> {end}\n{text}\n\n"
+
+    def footer(self):
+        return ""
+
+
+class JSONFormat:
+    """Compact segment list: {"params": {...}, "segments": [[start_ms, end_ms, text]]}"""
+
+    def header(self, params):
+        return f'{{"params": {json.dumps(params or {})}, "segments": [\n'
+
+    def cue(self, index, start_ms, end_ms, text):
+        separator = "" if index == 1 else ",\n"
+        return (
+            f"{separator}[{start_ms}, {end_ms}, {json.dumps(text, ensure_ascii=False)}]"
+        )
+
+    def footer(self):
+        return "\n]}\n"
+
+
+FORMATS = {"srt": SRTFormat, "vtt": VTTFormat, "json": JSONFormat}
+
+
+class SubtitleWriter:
+    """Write the same cues to several subtitle formats in one pass
+
+    Cues are formatted into per-format buffers that are written out every
+    `chunk_cues` cues, so each file gets a few large writes whether the cues
+    come from a list or are streamed from a generator.
+
+    `params` are recorded in each format's header, and for SRT, which has
+    no place for them, in the params_file next to it.
+
+    Usage:
+        with SubtitleWriter({"srt": "a.srt", "json": "a.json"}) as writer:
+            for start, end, text in cues:
+                writer.add(start, end, text)
+    """
+
+    def __init__(self, outputs, params=None, chunk_cues=1000):
+        self.outputs = outputs
+        self.params = params
+        self.chunk_cues = chunk_cues
+        self.count = 0
+        self._formats = {fmt: FORMATS[fmt]() for fmt in outputs}
+        self._files = {}
+        self._buffers = {}
+
+    def __enter__(self):
+        for fmt, path in self.outputs.items():
+            self._files[fmt] = open(path, "w", encoding="utf-8")
+            self._buffers[fmt] = [self._formats[fmt].header(self.params)]
+        return self
+
+    def add(self, start, end, text):
+        """Add one cue, with start and end in seconds"""
+        self.count += 1
+        start_ms, end_ms = to_milliseconds(start), to_milliseconds(end)
+        for fmt, buffer in self._buffers.items():
+            buffer.append(self._formats[fmt].cue(self.count, start_ms, end_ms, text))
+        if self.count % self.chunk_cues == 0:
+            self.flush()
+
+    def flush(self):
+        for fmt, buffer in self._buffers.items():
+            self._files[fmt].write("".join(buffer))
+            buffer.clear()
+
+    def __exit__(self, exc_type, exc, tb):
+        for fmt, buffer in self._buffers.items():
+            buffer.append(self._formats[fmt].footer())
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        if exc_type is None and "srt" in self.outputs:
+            write_params(self.outputs["srt"], self.params)
+        return False
+
+
+def load_json_segments(json_file):
+    """Read a JSON segment list back as [(start_seconds, end_seconds, text), ...]"""
+    with open(json_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [(start / 1000, end / 1000, text) for start, end, text in data["segments"]]
+
+
+class CueTable:
+    """Subtitle cues stored as parallel arrays
+
+    Start and end times (seconds) are kept in `array("d")` and the texts in a
+    list, so 100k cues take a few MB instead of one dict per cue. Indexing
+    and iteration give (start, end, text) tuples.
+    """
+
+    __slots__ = ("starts", "ends", "texts")
+
+    def __init__(self):
+        self.starts = array("d")
+        self.ends = array("d")
+        self.texts = []
+
+    def append(self, start, end, text):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.texts.append(text)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, index):
+        return self.starts[index], self.ends[index], self.texts[index]
+
+    def __iter__(self):
+        return zip(self.starts, self.ends, self.texts)
+
+
+def parse_srt_lines(lines):
+    """Parse SRT (or WebVTT) lines into a CueTable in one pass
+
+    Works line by line on any iterable, such as an open file. CRLF line ends,
+    a BOM, NOTE blocks and missing blank lines between cues are tolerated: a
+    number line directly followed by a timestamp line is taken as the cue
+    number, not as text of the previous cue.
+    """
+    table = CueTable()
+    starts, ends, texts = table.starts, table.ends, table.texts
+    text = None  # lines of the current cue, None outside a cue
+    number = None  # number line that may start the next cue
+    for line in lines:
+        line = line.rstrip()
+        if not line:
+            if text is not None:
+                if number is not None:
+                    text.append(number)
+                texts.append("\n".join(text))
+            text = number = None
+        elif "-->" in line:
+            if text is not None:
+                texts.append("\n".join(text))
+            start, _, end = line.lstrip("\ufeff").partition("-->")
+            starts.append(parse_timestamp(start) / 1000)
+            ends.append(parse_timestamp(end.split()[0]) / 1000)
+            text, number = [], None
+        elif text is not None:
+            if number is not None:
+                text.append(number)
+            if line.isdigit():
+                number = line
+            else:
+                text.append(line.strip())
+                number = None
+    if text is not None:
+        if number is not None:
+            text.append(number)
+        texts.append("\n".join(text))
+    return table
+
+
+def load_cues(subtitle_file):
+    """Load an SRT, WebVTT or JSON segment file as a CueTable"""
+    if subtitle_file.lower().endswith(".json"):
+        table = CueTable()
+        for start, end, text in load_json_segments(subtitle_file):
+            table.append(start, end, text)
+        return table
+    with open(subtitle_file, "r", encoding="utf-8-sig") as f:
+        return parse_srt_lines(f)
+
+
+def read_srt(srt_file):
+    """Read the cues of an SRT file as [(start_seconds, end_seconds, text), ...]"""
+    return list(load_cues(srt_file))
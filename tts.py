@@ -3,25 +3,120 @@ import os
 import wave
 import struct
 from pydub import AudioSegment
-import edge_tts
+
+from tts_scheduler import AdaptiveScheduler
+from tts_cache import TTSCache
+from audio_concat import concatenate_files
 
 # 更改为使用输入文件
 INPUT_FILE = "add.txt"
-OUTPUT_DIR = "temp_audio"
 FINAL_OUTPUT = "final_output.mp3"
 VOICE = "en-GB-SoniaNeural"
-
-
-async def generate_audio(text, output_file):
-    """为单行文本生成音频"""
-    communicate = edge_tts.Communicate(text, VOICE)
-    submaker = edge_tts.SubMaker()
-    with open(output_file, "wb") as file:
-        async for chunk in communicate.stream():
-            if chunk["type"] == "audio":
-                file.write(chunk["data"])
-            elif chunk["type"] == "WordBoundary":
-                submaker.feed(chunk)
+SPEECH_RATE = "+0%"  # 语速，如 "-10%"
+PITCH = "+0Hz"  # 音调，如 "+5Hz"
+CONCURRENCY = 8  # 开始时同时进行的合成请求数，之后按出错情况自动调整
+MAX_CONCURRENCY = 32
+RATE = 10.0  # 每秒最多发出的请求数
+MAX_RETRIES = 5
+
+
+async def generate_audio(
+    text, output_file, voice=VOICE, client=None, rate=SPEECH_RATE, pitch=PITCH
+):
+    """为单行文本生成音频
+
+    `client` 默认为 edge_tts.Communicate，可换成接口相同的替代
+    （client(text, voice, rate=..., pitch=...) 返回带有异步 stream() 的对象），
+    以便测试时使用本地的假服务；这时不需要安装 edge_tts，也不收集字词时间。
+    音频先写入 .part 临时文件，完整后才改名为 output_file，中断时不会留下
+    半个文件。
+    """
+    submaker = None
+    if client is None:
+        # 只有真正合成时才需要 edge_tts
+        import edge_tts
+
+        client = edge_tts.Communicate
+        submaker = edge_tts.SubMaker()
+    communicate = client(text, voice, rate=rate, pitch=pitch)
+    part_file = output_file + ".part"
+    try:
+        with open(part_file, "wb") as file:
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    file.write(chunk["data"])
+                elif chunk["type"] == "WordBoundary" and submaker is not None:
+                    submaker.feed(chunk)
+        os.replace(part_file, output_file)
+    finally:
+        if os.path.exists(part_file):
+            os.remove(part_file)
+
+
+async def generate_line(
+    number,
+    text,
+    output_file,
+    scheduler,
+    voice=VOICE,
+    client=None,
+    max_retries=MAX_RETRIES,
+    rate=SPEECH_RATE,
+    pitch=PITCH,
+):
+    """经由调度器为一行生成音频，出错时重试；成功时返回 True
+
+    重试前不再各自等待：出错时调度器让所有请求一起指数退避，并降低并发。
+    """
+    retry_count = 0
+    while retry_count < max_retries:
+        try:
+            await scheduler.run(
+                lambda: generate_audio(text, output_file, voice, client, rate, pitch)
+            )
+            print(f"已生成第 {number} 个音频: {text}")
+            return True
+        except Exception as e:
+            retry_count += 1
+            print(f"生成第 {number} 个音频出错: {e}, 第{retry_count}次重试")
+
+    print(f"达到最大重试次数，跳过音频 {number}")
+    return False
+
+
+async def generate_all(
+    jobs,
+    scheduler=None,
+    voice=VOICE,
+    client=None,
+    max_retries=MAX_RETRIES,
+    rate=SPEECH_RATE,
+    pitch=PITCH,
+):
+    """并发生成多行音频，速率和并发由 `scheduler`（AdaptiveScheduler）控制
+
+    `jobs` 为 [(行号, 文本, 输出文件), ...]。返回成功生成的文件，顺序与 jobs
+    相同（即行的顺序），与完成的先后无关。
+    """
+    if scheduler is None:
+        scheduler = AdaptiveScheduler(CONCURRENCY, MAX_CONCURRENCY, RATE)
+    results = await asyncio.gather(
+        *(
+            generate_line(
+                number,
+                text,
+                output_file,
+                scheduler,
+                voice,
+                client,
+                max_retries,
+                rate,
+                pitch,
+            )
+            for number, text, output_file in jobs
+        )
+    )
+    return [job[2] for job, ok in zip(jobs, results) if ok]
 
 
 def create_silence(seconds, output_file):
@@ -32,76 +127,74 @@ def create_silence(seconds, output_file):
     silence.export(output_file, format="mp3")
 
 
-def combine_audio_files(file_list, output_file):
-    """合并所有音频文件"""
-    combined = AudioSegment.empty()
-    silence = AudioSegment.silent(duration=4000)  # 4秒静音
-
-    for i, file in enumerate(file_list):
-        audio = AudioSegment.from_mp3(file)
-        combined += audio
+def combine_audio_files(file_list, output_file, gap_ms=4000):
+    """合并所有音频文件，文件之间加入 4 秒静音（最后一个文件之后不加）
 
-        # 在最后一个文件之后不添加静音
-        if i < len(file_list) - 1:
-            combined += silence
+    合成的片段格式相同，直接逐帧复制 MP3 数据、静音用预先编码的静音帧，
+    不解码也不重新编码，音质无损；格式不同时才逐个解码并经由编码器写入。
+    两种方式都不在内存中拼接整个结果，内存占用不随文件数增长。
+    """
+    concatenate_files(file_list, output_file, gap_ms)
 
-    combined.export(output_file, format="mp3")
 
-
-async def amain() -> None:
+async def amain(
+    input_file=INPUT_FILE,
+    final_output=FINAL_OUTPUT,
+    scheduler=None,
+    client=None,
+    cache=None,
+) -> None:
     """Main function"""
-    # 确保输出目录存在
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
+    # 片段缓存在用户目录下，各个项目共用
+    if cache is None:
+        cache = TTSCache()
 
     # 读取输入文件的每一行
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+    with open(input_file, "r", encoding="utf-8") as f:
         lines = f.readlines()
 
-    audio_files = []
-    max_retries = 5
+    keys = []
+    jobs = {}  # 缓存键 -> (行号, 文本, 输出文件)，相同的行只合成一次
+    cached = 0
 
-    # 为每一行生成音频
+    # 为每一行安排生成任务
     for i, line in enumerate(lines):
         line = line.strip()
         if not line:  # 跳过空行
             continue
 
-        # 生成文件名，格式为00001.mp3
-        output_file = os.path.join(OUTPUT_DIR, f"{i+1:05d}.mp3")
-
-        # 检查文件是否已存在
-        if os.path.exists(output_file):
-            print(f"文件 {output_file} 已存在，跳过生成")
-            audio_files.append(output_file)
+        # 片段以文本、声音、语速和音调的哈希命名，改动的行才需要重新合成
+        key = cache.key(line, VOICE, SPEECH_RATE, PITCH)
+        keys.append(key)
+        if key in jobs:
             continue
-
-        print(f"正在生成第 {i+1} 个音频: {line}")
-
-        # 指数退避重试
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                await generate_audio(line, output_file)
-                audio_files.append(output_file)
-                break
-            except Exception as e:
-                retry_count += 1
-                wait_time = 2**retry_count  # 指数退避：1, 2, 4, 8, 16秒
-                print(f"生成音频出错: {e}, 第{retry_count}次重试, 等待{wait_time}秒")
-                await asyncio.sleep(wait_time)
-
-        if retry_count == max_retries:
-            print(f"达到最大重试次数，跳过音频 {i+1}")
-            # 删除生成的文件
-            if os.path.exists(output_file):
-                os.remove(output_file)
-
-    # 合并所有音频文件
+        if cache.contains(key):
+            cached += 1
+            continue
+        jobs[key] = (i + 1, line, cache.path(key))
+    print(f"共 {len(keys)} 行，{cached} 行已有缓存，需要生成 {len(jobs)} 个片段")
+
+    # 并发生成，失败的行不会留下文件
+    if scheduler is None:
+        scheduler = AdaptiveScheduler(CONCURRENCY, MAX_CONCURRENCY, RATE)
+    if jobs:
+        generated = await generate_all(
+            list(jobs.values()), scheduler, VOICE, client, rate=SPEECH_RATE, pitch=PITCH
+        )
+        for line in scheduler.summary():
+            print(line)
+        generated = set(generated)
+        for key, (_, text, output_file) in jobs.items():
+            if output_file in generated:
+                cache.add(key, text, VOICE)
+    cache.save(keep=keys)
+    audio_files = [cache.path(key) for key in keys if os.path.exists(cache.path(key))]
+
+    # 合并所有音频文件（按行的顺序）
     if audio_files:
         print("正在合并所有音频文件...")
-        combine_audio_files(audio_files, FINAL_OUTPUT)
-        print(f"完成! 最终文件已保存为 {FINAL_OUTPUT}")
+        combine_audio_files(audio_files, final_output)
+        print(f"完成! 最终文件已保存为 {final_output}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "AudioDictationKit", "tts"
+)
+DEFAULT_MAX_BYTES = 2 * 1024**3  # 2 GiB
+
+
+class TTSCache:
+    """按内容寻址的语音片段缓存，多个项目共用
+
+    片段以 (文本, 声音, 语速, 音调) 的哈希命名，所以在 add.txt 中插入或删除
+    一行不会错用其他行的音频，改变声音或语速时也会重新合成。索引文件
+    index.json 记录每个片段的大小、文本和最后使用时间，总大小超过 `max_bytes`
+    时删除最久没用的片段。
+
+    索引只在 save() 时写入一次（与磁盘上的索引合并，其他项目同时使用缓存也不会
+    丢失记录），所以几千行的文本也只读写一次索引。
+
+    用法:
+        cache = TTSCache()
+        key = cache.key("Hello", "en-GB-SoniaNeural")
+        if not cache.contains(key):
+            synthesize("Hello", cache.path(key))
+            cache.add(key, "Hello", "en-GB-SoniaNeural")
+        cache.save(keep=[key])
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(cache_dir, "index.json")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                return json.load(f).get("entries", {})
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(text, voice, rate="+0%", pitch="+0Hz"):
+        params = json.dumps([text, voice, rate, pitch], ensure_ascii=False)
+        return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def contains(self, key):
+        """片段是否已缓存；已缓存时记为刚刚使用"""
+        entry = self.entries.get(key)
+        if entry is None or not os.path.exists(self.path(key)):
+            return False
+        entry["last_used"] = time.time()
+        return True
+
+    def add(self, key, text, voice):
+        """记录已写入 path(key) 的新片段"""
+        self.entries[key] = {
+            "size": os.path.getsize(self.path(key)),
+            "text": text,
+            "voice": voice,
+            "last_used": time.time(),
+        }
+
+    def save(self, keep=()):
+        """合并并写入索引，按最后使用时间淘汰超出大小的片段（`keep` 中的除外）"""
+        entries = self._read_index()
+        for key, entry in self.entries.items():
+            known = entries.get(key)
+            if known is None or known.get("last_used", 0) < entry["last_used"]:
+                entries[key] = entry
+        # 文件已被删除的记录
+        entries = {
+            key: entry
+            for key, entry in entries.items()
+            if os.path.exists(self.path(key))
+        }
+
+        keep = set(keep)
+        total = sum(entry["size"] for entry in entries.values())
+        by_age = sorted(entries, key=lambda k: entries[k].get("last_used", 0))
+        for key in by_age:
+            if total <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"无法删除缓存的音频 {key}: {e}")
+                continue
+            total -= entries.pop(key)["size"]
+
+        # 先写入临时文件，其他进程不会读到写了一半的索引
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_file)
+        self.entries = entries
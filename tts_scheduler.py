@@ -0,0 +1,164 @@
+import time
+import asyncio
+
+from instrumentation import Histogram
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 `rate` 个请求，空闲后最多连续发出 `burst` 个"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def take(self):
+        """取一个令牌；取到时返回 0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+class AdaptiveScheduler:
+    """所有请求共享的调度器：令牌桶限速 + AIMD 自适应并发 + 全局退避
+
+    并发上限按 AIMD 调整：每连续成功"上限"个请求就加 1（最多
+    `max_concurrency`），出错时乘以 `decrease`（至少为 1）。同一批同时在进行
+    的请求接连出错只算一次，不会把上限一下降到底。出错时所有请求暂停
+    `backoff` 秒，连续几批都出错时暂停时间加倍（最多 `max_backoff` 秒），
+    一有成功即恢复。这样被限流时是整体放慢，而不是每个请求各自重试、一起
+    再次撞上服务。
+
+    `latency` 和 `error_latency` 为请求耗时的 Histogram，`counts` 记录请求、
+    成功和失败数，summary() 返回可打印的统计。
+
+    用法:
+        scheduler = AdaptiveScheduler(concurrency=8)
+        audio = await scheduler.run(lambda: fetch(text))
+        print("\n".join(scheduler.summary()))
+    """
+
+    def __init__(
+        self,
+        concurrency=8,
+        max_concurrency=32,
+        rate=10.0,
+        burst=10,
+        decrease=0.5,
+        backoff=1.0,
+        max_backoff=60.0,
+    ):
+        self.limit = float(concurrency)
+        self.max_concurrency = max_concurrency
+        self.decrease = decrease
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate, burst)
+        self.in_flight = 0
+
+        self.latency = Histogram()
+        self.error_latency = Histogram()
+        self.counts = {"requests": 0, "succeeded": 0, "failed": 0}
+        self.limit_range = [self.limit, self.limit]
+
+        # Python 3.10 以前 Condition 绑定创建时的事件循环，所以在第一次 run()
+        # 时（即在运行的循环中）才创建
+        self._condition = None
+        self._epoch = 0  # 每次因出错降低上限后加 1
+        self._successes = 0
+        self._error_epochs = 0  # 连续出错的批数，决定退避时间
+        self._paused_until = 0.0
+
+    async def run(self, request):
+        """在并发上限和速率内执行 `request()`（返回可等待对象），返回其结果
+
+        出错时记录并重新抛出异常，由调用方决定是否重试。
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            await self._wait_turn()
+            epoch = self._epoch
+            self.counts["requests"] += 1
+            start = time.perf_counter()
+            try:
+                result = await request()
+            except Exception:
+                self._failed(epoch, time.perf_counter() - start)
+                raise
+            self._succeeded(time.perf_counter() - start)
+            return result
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    async def _wait_turn(self):
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                delay = self.bucket.take()
+                if delay == 0:
+                    return
+            await asyncio.sleep(delay)
+
+    def _set_limit(self, limit):
+        self.limit = limit
+        self.limit_range[0] = min(self.limit_range[0], limit)
+        self.limit_range[1] = max(self.limit_range[1], limit)
+
+    def _succeeded(self, seconds):
+        self.counts["succeeded"] += 1
+        self.latency.add(seconds)
+        self._error_epochs = 0
+        # 加性增：大约每一轮（上限个请求）都成功时加 1
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            self._set_limit(min(self.max_concurrency, self.limit + 1))
+
+    def _failed(self, epoch, seconds):
+        self.counts["failed"] += 1
+        self.error_latency.add(seconds)
+        if epoch != self._epoch:
+            # 上次降低上限之前就已发出的请求，不再重复惩罚
+            return
+        self._epoch += 1
+        self._successes = 0
+        # 乘性减，并让所有请求一起暂停
+        self._set_limit(max(1.0, self.limit * self.decrease))
+        pause = min(self.max_backoff, self.backoff * 2**self._error_epochs)
+        self._error_epochs += 1
+        self._paused_until = time.monotonic() + pause
+
+    def summary(self):
+        counts = self.counts
+        error_rate = counts["failed"] / counts["requests"] if counts["requests"] else 0
+        return [
+            f"请求 {counts['requests']} 次，成功 {counts['succeeded']}，"
+            f"失败 {counts['failed']}（{error_rate:.1%}）",
+            f"成功请求耗时: {self.latency.summary()}",
+            f"失败请求耗时: {self.error_latency.summary()}",
+            f"并发上限: 当前 {int(self.limit)}，"
+            f"范围 {int(self.limit_range[0])}-{int(self.limit_range[1])}",
+        ]
+
+    def to_dict(self):
+        return {
+            "counts": dict(self.counts),
+            "latency": self.latency.to_dict(),
+            "error_latency": self.error_latency.to_dict(),
+            "concurrency": {
+                "current": int(self.limit),
+                "min": int(self.limit_range[0]),
+                "max": int(self.limit_range[1]),
+            },
+        }